@@ -53,6 +53,9 @@ def copy_flow_graph(source_graph, dest_graph):
     dest_graph.add_nodes_from(
         (node, data) for node, data in source_graph.nodes(data=True)
         if node not in skip)
+    # Edge keys are not copied: node names may collide across flow graphs
+    # (e.g., successive recordings), and copied edges must not overwrite
+    # existing ones.
     dest_graph.add_edges_from(
         edge for edge in source_graph.edges(data=True)
         if edge[0] not in skip and edge[1] not in skip)
@@ -158,53 +161,88 @@ def flatten(graph, copy=True):
     """
     if copy:
         graph = graph.copy()
+    
+    # Collect the nested graphs level by level. Only nested graphs that
+    # themselves contain nested graphs are modified when lifting, so only
+    # those need to be copied and scanned for the next level. In the common
+    # case of a single level of nesting, no nested graph is copied.
+    levels = []
+    parents = [ graph ]
+    while parents:
+        level, nested = [], []
+        for parent in parents:
+            for node, data in parent.nodes(data=True):
+                subgraph = data.get('graph', None)
+                if subgraph:
+                    if _has_nested_graph(subgraph):
+                        if copy:
+                            subgraph = subgraph.copy()
+                        nested.append(subgraph)
+                    level.append((parent, node, subgraph))
+        levels.append(level)
+        parents = nested
+    
+    # Lift the nested graphs into their parents, deepest first, so that every
+    # nested graph is already flat when it is lifted.
+    for level in reversed(levels):
+        for parent, node, subgraph in level:
+            _lift_nested_graph(parent, node, subgraph)
+    
+    return graph
+
+def _has_nested_graph(graph):
+    """ Does the flow graph have any nodes with nested graphs?
+    """
+    return any(data.get('graph', None) for _, data in graph.nodes(data=True))
+
+def _lift_nested_graph(graph, node, subgraph):
+    """ Replace a node of a flow graph by its (flat) nested graph.
+    """
     input_node = graph.graph['input_node']
-    output_node = graph.graph['output_node']
+    sub_input_node = subgraph.graph['input_node']
+    sub_output_node = subgraph.graph['output_node']
     
-    for node in list(graph.nodes):
-        subgraph = graph.nodes[node].get('graph', None)
-        if not subgraph:
-            continue
-        subgraph = flatten(subgraph, copy=False)
-        sub_input_node = subgraph.graph['input_node']
-        sub_output_node = subgraph.graph['output_node']
-        
-        # First, add all nodes and edges from the subgraph.
-        copy_flow_graph(subgraph, graph)
-        
-        # Re-wire the input objects of the subgraph.
-        for _, tgt, data in subgraph.out_edges(sub_input_node, data=True):
-            obj_id, tgt_port = data['id'], data['targetport']
-            
-            # Try to find an incoming edge in the parent graph carrying the
-            # above object. There could be multiple edges carrying the object
-            # (if the same object is passed to multiple arguments) but we need
-            # only consider one because they should all have the same source.
-            for src, _, data in graph.in_edges(node, data=True):
-                if data['id'] == obj_id:
-                    data.pop('targetport', None)
-                    graph.add_edge(src, tgt, targetport=tgt_port, **data)
-                    break
-            # If that fails, add a new input object to the parent graph.
-            else:
-                graph.add_edge(input_node, tgt, **data)
+    # Index the edges of the node in the parent graph by object ID.
+    # There could be multiple incoming edges carrying the same object (if the
+    # same object is passed to multiple arguments) but we need only consider
+    # one because they should all have the same source.
+    in_edges = {}
+    for src, _, data in graph.in_edges(node, data=True):
+        in_edges.setdefault(data['id'], (src, data))
+    out_edges = {}
+    for _, tgt, data in graph.out_edges(node, data=True):
+        out_edges.setdefault(data['id'], []).append((tgt, data))
+    
+    # First, add all nodes and edges from the subgraph.
+    copy_flow_graph(subgraph, graph)
+    
+    # Re-wire the input objects of the subgraph.
+    edges = []
+    for _, tgt, sub_data in subgraph.out_edges(sub_input_node, data=True):
+        obj_id, tgt_port = sub_data['id'], sub_data['targetport']
         
-        # Re-wire the output objects of the subgraph.
-        for src, _, data in subgraph.in_edges(sub_output_node, data=True):
-            obj_id, src_port = data['id'], data['sourceport']
-            
-            # Find outgoing edges in the parent graph carrying the above object.
-            # If there are none, forget about the output: it cannot be a return
-            # value or a mutated argument, hence is lost to the outer scope.
-            for _, tgt, data in graph.out_edges(node, data=True):
-                if data['id'] == obj_id:
-                    data.pop('sourceport', None)
-                    graph.add_edge(src, tgt, sourceport=src_port, **data)
+        # Try to find an incoming edge in the parent graph carrying the
+        # above object.
+        if obj_id in in_edges:
+            src, data = in_edges[obj_id]
+            edges.append((src, tgt, dict(data, targetport=tgt_port)))
+        # If that fails, add a new input object to the parent graph.
+        else:
+            edges.append((input_node, tgt, sub_data))
+    
+    # Re-wire the output objects of the subgraph.
+    for src, _, sub_data in subgraph.in_edges(sub_output_node, data=True):
+        obj_id, src_port = sub_data['id'], sub_data['sourceport']
         
-        # Finally, remove the original node (and its edges).
-        graph.remove_node(node)
+        # Find outgoing edges in the parent graph carrying the above object.
+        # If there are none, forget about the output: it cannot be a return
+        # value or a mutated argument, hence is lost to the outer scope.
+        for tgt, data in out_edges.get(obj_id, ()):
+            edges.append((src, tgt, dict(data, sourceport=src_port)))
+    graph.add_edges_from(edges)
     
-    return graph
+    # Finally, remove the original node (and its edges).
+    graph.remove_node(node)
 
 
 def join(first, second, copy=True):
@@ -223,22 +261,24 @@ def join(first, second, copy=True):
     copy_flow_graph(second, graph)
 
     # Add inputs from the second graph.
+    edges = []
     for _, tgt, data in second.out_edges(second.graph['input_node'], data=True):
         # If there is a corresponding output of the first graph, use it.
         if data['id'] in output_table:
             src, key = output_table[data['id']]
-            src_port = graph.edges[src,output_node,key]['sourceport']
-            graph.add_edge(src, tgt, sourceport=src_port, **data)
+            src_port = graph[src][output_node][key]['sourceport']
+            edges.append((src, tgt, dict(data, sourceport=src_port)))
         # Otherwise, add the input to the first graph.
         else:
-            graph.add_edge(input_node, tgt, **data)
+            edges.append((input_node, tgt, data))
+    graph.add_edges_from(edges)
     
     # Add outputs from the second graph, overwriting outputs of the first graph
     # if there is a conflict.
-    for src, _, data in second.in_edges(second.graph['output_node'], data=True):
-        if data['id'] in output_table:
-            old, key = output_table[data['id']]
-            graph.remove_edge(old, output_node, key=key)
-        graph.add_edge(src, output_node, **data)
-        
+    edges = list(second.in_edges(second.graph['output_node'], data=True))
+    stale = [ output_table[data['id']] for _, _, data in edges
+              if data['id'] in output_table ]
+    graph.remove_edges_from((old, output_node, key) for old, key in stale)
+    graph.add_edges_from((src, output_node, data) for src, _, data in edges)
+    
     return graph
@@ -15,14 +15,16 @@
 from __future__ import absolute_import
 
 from collections import deque, OrderedDict
+from itertools import chain
 import six
+from six.moves import intern
 import sys
 import types
 from weakref import WeakKeyDictionary
 
 from ipykernel.jsonutil import json_clean
 import networkx as nx
-from traitlets import HasTraits, Bool, Dict, Instance, Unicode, default
+from traitlets import HasTraits, Bool, Dict, Instance, default
 
 from .annotator import Annotator
 from .flow_graph import new_flow_graph
@@ -32,6 +34,43 @@ from ..trace.object_tracker import ObjectTracker
 from ..trace.trace_event import TraceEvent, TraceCall, TraceReturn, \
     TraceAccess, TraceAssign, TraceDelete
 
+# Scalar types that are always primitive, regardless of their value.
+_PRIMITIVE_TYPES = (bool, float, bytes, six.text_type, type(None)) + \
+    six.integer_types
+
+# Methods of `FlowGraphBuilder` handling each type of trace event.
+_EVENT_HANDLERS = OrderedDict((
+    (TraceCall, '_push_call_event'),
+    (TraceReturn, '_push_return_event'),
+    (TraceAccess, '_push_access_event'),
+    (TraceAssign, '_push_assign_event'),
+    (TraceDelete, '_push_delete_event'),
+))
+
+# Important functions known to be impure, and the arguments they mutate.
+_IMPURE_FUNCTIONS = frozenset(('setattr', 'setitem'))
+_IMPURE_ARGUMENTS = frozenset(('obj', '0'))
+
+# Precomputed names of output ports for multiple return values.
+_RETURN_PORT_NAMES = tuple('return.%i' % i for i in range(32))
+
+# Memoized names of output ports for mutated arguments. Argument names come
+# from a small, finite set in any given program, so the cache stays bounded.
+_MUTATED_PORT_NAMES = {}
+
+# Insertion-ordered mapping type for ports. As of Python 3.7, plain dicts are
+# guaranteed to preserve insertion order and are cheaper than `OrderedDict`.
+_ordered_dict = dict if sys.version_info >= (3, 7) else OrderedDict
+
+# Scalar types that `json_clean` returns unmodified.
+_JSON_SCALAR_TYPES = (bool, six.text_type, type(None)) + six.integer_types
+
+# Container types, whose primitiveness depends on their contents.
+_CONTAINER_TYPES = (tuple, list, dict, set, frozenset)
+
+# Name of the iterator protocol method.
+_NEXT_ATTR_NAME = '__next__' if six.PY3 else 'next'
+
 
 class FlowGraphBuilder(HasTraits):
     """ Build an object flow graph from a stream of trace events.
@@ -53,6 +92,7 @@ class FlowGraphBuilder(HasTraits):
     store_slots = Bool(True)
     
     # Private traits.
+    _atomic_context_pool = Instance(list, ()) # List(Instance(_CallContext))
     _node_names = Dict()
     _stack = Instance(deque, ()) # List(Instance(_CallContext))
     
@@ -60,11 +100,52 @@ class FlowGraphBuilder(HasTraits):
     
     def __init__(self, **traits):
         super(FlowGraphBuilder, self).__init__(**traits)
+        
+        # Version counters for the flow graph and its cached copy. These are
+        # updated on every trace event, so they are plain attributes rather
+        # than traits, which are much slower to set.
+        self._graph_copy = None
+        self._graph_copy_version = -1
+        self._graph_version = 0
+        self._reset_version = -1
+        
+        # Cache: mapping from type to whether its instances are primitive.
+        # Weakly keyed, so that classes redefined in a session are freed.
+        self._primitive_type_cache = WeakKeyDictionary()
+        
+        # Bound methods handling each type of trace event, for dispatch by
+        # exact type. Subclasses are resolved by `_get_event_handler`.
+        self._event_handlers = {
+            event_type: getattr(self, name)
+            for event_type, name in _EVENT_HANDLERS.items()
+        }
         self.reset()
     
+    @property
+    def graph_version(self):
+        """ Version number of the flow graph.
+        
+        The version changes whenever the flow graph may have changed, i.e., when
+        trace events are pushed or the builder is reset, so it can be used as a
+        key for caching data derived from the graph.
+        """
+        return self._graph_version
+    
     @property
     def graph(self):
         """ Top-level flow graph.
+        
+        The graph is a frozen copy, which is cached until the next trace event
+        is pushed or the builder is reset, and is shared by all callers until
+        then. To get a graph that can be modified, call `copy_graph()`.
+        """
+        if self._graph_copy_version != self._graph_version:
+            self._graph_copy = nx.freeze(self.copy_graph())
+            self._graph_copy_version = self._graph_version
+        return self._graph_copy
+    
+    def copy_graph(self):
+        """ Get a new, modifiable copy of the top-level flow graph.
         """
         # Make a shallow copy.
         return nx.MultiDiGraph(self._stack[0].graph)
@@ -72,18 +153,53 @@ class FlowGraphBuilder(HasTraits):
     def push_event(self, event):
         """ Push a new trace event to the builder.
         """
-        if isinstance(event, TraceCall): self._push_call_event(event)
-        elif isinstance(event, TraceReturn): self._push_return_event(event)
-        elif isinstance(event, TraceAccess): self._push_access_event(event)
-        elif isinstance(event, TraceAssign): self._push_assign_event(event)
-        elif isinstance(event, TraceDelete): self._push_delete_event(event)
+        # Invalidate the cached copy of the flow graph.
+        self._graph_version += 1
+        
+        handler = self._event_handlers.get(type(event))
+        if handler is None:
+            handler = self._get_event_handler(type(event))
+        handler(event)
+    
+    def push_change(self, change):
+        """ Push the trace event from a traitlets change notification.
+        
+        Meant to be registered directly as an observer of a tracer's `event`
+        trait. Empty events are ignored.
+        """
+        event = change['new']
+        if event:
+            self.push_event(event)
+    
+    def push_events(self, events):
+        """ Push a sequence of trace events to the builder.
+        """
+        # Invalidate the cached copy of the flow graph.
+        self._graph_version += 1
+        
+        handlers = self._event_handlers
+        for event in events:
+            handler = handlers.get(type(event))
+            if handler is None:
+                handler = self._get_event_handler(type(event))
+            handler(event)
     
     def reset(self):
         """ Reset the flow graph builder.
         """
         # The bottom of the call stack does not correspond to a call event.
         # It simply contains the root flow graph and associated state.
+        # If no events were pushed since the last reset, the builder is still
+        # in its initial state, and the graph version stays valid. But drop the
+        # cached copy of the graph, which callers may have modified.
+        self._graph_copy = None
+        self._graph_copy_version = -1
+        if self._stack and self._graph_version == self._reset_version:
+            return
+        
         graph = new_flow_graph()
+        self._graph_version += 1
+        self._reset_version = self._graph_version
         self._node_names = {}
         self._stack.clear()
         self._stack.append(_CallContext(graph=graph))
@@ -120,6 +236,19 @@ class FlowGraphBuilder(HasTraits):
         is JSON-able (essentially, the scalar types plus the built-in container
         types if their contents are JSON-able).
         """
+        # Fast path: scalar types are always primitive.
+        obj_type = type(obj)
+        if obj_type in _PRIMITIVE_TYPES:
+            return True
+        
+        # Fast path: the result for types other than containers and iterators
+        # depends only on the type, so it is cached.
+        type_cache = self._primitive_type_cache
+        cacheable = not (isinstance(obj, _CONTAINER_TYPES) or
+                         hasattr(obj_type, _NEXT_ATTR_NAME))
+        if cacheable and obj_type in type_cache:
+            return type_cache[obj_type]
+        
         # Make sure not to modify the passed object.
         if isinstance(obj, types.GeneratorType):
             # Do not pass a generator through `json_clean`, as it will convert
@@ -130,8 +259,12 @@ class FlowGraphBuilder(HasTraits):
         try:
             json_clean(obj)
         except ValueError:
-            return False
-        return True
+            result = False
+        else:
+            result = True
+        if cacheable:
+            type_cache[obj_type] = result
+        return result
     
     def is_pure(self, event, annotation, arg_name):
         """ Is the function call event pure with respect to the given argument?
@@ -158,16 +291,28 @@ class FlowGraphBuilder(HasTraits):
         a hash of the underlying data.
         """
         # Special case: important functions knowns to be impure.
-        if (event.qual_name in ('setattr', 'setitem') and
-            arg_name in ('obj', '0')):
+        if (event.qual_name in _IMPURE_FUNCTIONS and
+            arg_name in _IMPURE_ARGUMENTS):
             return False
         
         # Default: pure unless explicitly annotated otherwise!
-        outputs = annotation.get('outputs', [])
+        outputs = annotation.get('outputs')
+        if not outputs:
+            return True
         slots = _IOSlots(event)
         return not any(arg_name == slots._name(obj['slot']) for obj in outputs)
     
     # Protected interface
+    
+    def _get_event_handler(self, event_type):
+        """ Get the method handling trace events of the given type.
+        
+        Events of unknown type are ignored.
+        """
+        for handled_type, name in _EVENT_HANDLERS.items():
+            if issubclass(event_type, handled_type):
+                return getattr(self, name)
+        return lambda event: None
             
     def _push_call_event(self, event):
         """ Push a call event onto the stack.
@@ -181,18 +326,29 @@ class FlowGraphBuilder(HasTraits):
         node = self._add_call_node(event, annotation)
         
         # Add edges for function arguments.
-        for arg_name in event.arguments.keys():
-            self._add_call_in_edge(event, node, arg_name)
+        for arg_name, arg in event.arguments.items():
+            self._add_call_in_edge(event, node, arg_name, arg)
         
         # If the call is not atomic, we will enter a new scope.
         # Create a nested flow graph for the node.
-        nested = None
-        if not event.atomic:
+        if event.atomic:
+            # No events occur inside an atomic call, so its context is never
+            # used for anything but retrieving the node on return. Reuse a
+            # context from the pool instead of allocating its tables.
+            pool = self._atomic_context_pool
+            call_context = pool.pop() if pool else _CallContext()
+            call_context.event = event
+            call_context.node = node
+            call_context.annotation = annotation
+        else:
             nested = new_flow_graph()
             graph.nodes[node]['graph'] = nested
+            call_context = _CallContext(
+                event=event, node=node, graph=nested, annotation=annotation)
     
         # Push call context onto stack.
-        self._stack.append(_CallContext(event=event, node=node, graph=nested))
+        context.annotation_cache.clear()
+        self._stack.append(call_context)
         
     def _push_return_event(self, event):
         """ Push a return event and pop the corresponding call from the stack.
@@ -202,7 +358,11 @@ class FlowGraphBuilder(HasTraits):
         if not context.event.full_name == event.full_name:
             # Sanity check
             raise RuntimeError("Mismatched trace events")
-        node = context.node
+        node, annotation = context.node, context.annotation
+        if event.atomic:
+            # Return the context to the pool, dropping its references.
+            context.event, context.annotation = None, None
+            self._atomic_context_pool.append(context)
 
         # Get graph containing this node from context of previous call.
         context = self._stack[-1]
@@ -216,25 +376,27 @@ class FlowGraphBuilder(HasTraits):
             return
         
         # Set output for return value(s).
+        object_tracker = self.object_tracker
         if event.multiple_values:
             # Interpret tuples as multiple return values, per Python convention.
             for i, value in enumerate(return_value):
-                value_id = self.object_tracker.maybe_track(value)
+                value_id = object_tracker.maybe_track(value)
                 if value_id:
                     self._set_object_output_node(
-                        event, value, value_id, node, 'return.%i' % i)
+                        event, value, value_id, node, _return_port_name(i))
         else:
             # All other objects are treated as a single return value.
-            return_id = self.object_tracker.maybe_track(return_value)
+            return_id = object_tracker.maybe_track(return_value)
             if return_id:
                 self._set_object_output_node(
                     event, return_value, return_id, node, 'return')
         
         # Set outputs for mutated arguments.
-        annotation = self.annotator.notate_function(event.function) or {}
-        for arg_name, arg in event.arguments.items():
-            arg_id = self.object_tracker.get_id(arg)
-            if arg_id and not self.is_pure(event, annotation, arg_name):
+        mutated = [ (arg_name, arg) for arg_name, arg in event.arguments.items()
+                    if not self.is_pure(event, annotation, arg_name) ]
+        for arg_name, arg in mutated:
+            arg_id = object_tracker.get_id(arg)
+            if arg_id:
                 port = self._mutated_port_name(arg_name)
                 self._set_object_output_node(event, arg, arg_id, node, port)
         
@@ -242,7 +404,9 @@ class FlowGraphBuilder(HasTraits):
         context.event_table[event] = (node, 'return')
         
         # Update node and port data for this call.
-        self._update_call_node_for_return(event, annotation, node)
+        self._update_call_node_for_return(
+            event, annotation, node, [ arg_name for arg_name, _ in mutated ])
+        context.annotation_cache.clear()
     
     def _push_access_event(self, event):
         """ Update event table for variable access event.
@@ -261,19 +425,17 @@ class FlowGraphBuilder(HasTraits):
         if isinstance(event.name, six.string_types):
             # Case 1: simple assignment.
             value_id = self.object_tracker.get_id(value)
-            if value_id and value_id in context.output_table:
-                source = context.output_table[value_id]
-            elif value_event and value_event in context.event_table:
-                source = context.event_table[value_event]
-            else:
-                source = None
+            source = context.output_table.get(value_id) if value_id else None
+            if source is None and value_event:
+                source = context.event_table.get(value_event)
             if source is not None:
                 context.variable_table[event.name] = source
 
         else:
             # Case 2: compound assignment.
+            object_tracker = self.object_tracker
             for i, name in enumerate(event.name):
-                value_id = self.object_tracker.get_id(value[i])
+                value_id = object_tracker.get_id(value[i])
                 if value_id and value_id in context.output_table:
                     source = context.output_table[value_id]
                 elif value_event and value_event in context.event_table:
@@ -315,8 +477,11 @@ class FlowGraphBuilder(HasTraits):
         graph.add_node(node, **data)
         return node
     
-    def _update_call_node_for_return(self, event, annotation, node):
+    def _update_call_node_for_return(self, event, annotation, node,
+                                     mutated_names):
         """ Update node and port data of call node for a return event.
+        
+        The names of the arguments mutated by the call must be given.
         """
         context = self._stack[-1]
         graph = context.graph
@@ -332,23 +497,23 @@ class FlowGraphBuilder(HasTraits):
                 self._update_constructor_node_for_return(event, node)
         
         # Add output ports.
-        port_names = []
+        return_names = []
         return_value = event.value
         if event.multiple_values:
-            port_names.extend([ 'return.%i' % i
-                                for i in range(len(return_value)) ])
+            return_names.extend([ _return_port_name(i)
+                                  for i in range(len(return_value)) ])
         elif return_value is not None:
-            port_names.append('return')
-        for arg_name in event.arguments.keys():
-            if not self.is_pure(event, annotation, arg_name):
-                port_names.append((arg_name, self._mutated_port_name(arg_name)))
+            return_names.append('return')
+        mutated_ports = [ (arg_name, self._mutated_port_name(arg_name))
+                          for arg_name in mutated_names ]
         
         ports = data['ports']
         ports.update(self._get_ports_data(
             event,
-            port_names,
+            return_names,
             [ dom['slot'] for dom in annotation.get('outputs', []) ],
             { 'portkind': 'output' },
+            renamed=mutated_ports,
         ))
         
         return True
@@ -361,7 +526,7 @@ class FlowGraphBuilder(HasTraits):
         
         args = list(event.arguments.values())
         obj, name = args[0], args[1]
-        note = self.annotator.notate_object(obj) or {}
+        note = self._notate_object(obj) or {}
         for slot_index, slot_def in enumerate(note.get('slots', [])):
             slot = slot_def['slot']
             if slot == name:
@@ -380,7 +545,7 @@ class FlowGraphBuilder(HasTraits):
         """
         context = self._stack[-1]
         data = context.graph.nodes[node]
-        note = self.annotator.notate_object(event.value)
+        note = self._notate_object(event.value)
         if note:
             data.update({
                 'annotation': self._annotation_key(note),
@@ -389,24 +554,22 @@ class FlowGraphBuilder(HasTraits):
         else:
             data['construct'] = True
     
-    def _add_call_in_edge(self, event, node, arg_name):
+    def _add_call_in_edge(self, event, node, arg_name, arg):
         """ Add an incoming edge to a call node.
         """
         # Track argument, if possible.
         context = self._stack[-1]
-        arg = event.arguments[arg_name]
         arg_id = self.object_tracker.maybe_track(arg)
 
         # Get source node and port corresponding to argument, if possible.
-        arg_event = event.argument_events.get(arg_name)
-        if arg_id and arg_id in context.output_table:
-            # First, check if argument object is tracked.
-            src, src_port = context.output_table[arg_id]
-        elif arg_event and arg_event in context.event_table:
+        # First, check if argument object is tracked.
+        source = context.output_table.get(arg_id) if arg_id else None
+        if source is None:
             # If that fails, fall back to static analysis, via the event table.
-            src, src_port = context.event_table[arg_event]
-        else:
-            src, src_port = None, None
+            arg_event = event.argument_events.get(arg_name)
+            if arg_event:
+                source = context.event_table.get(arg_event)
+        src, src_port = source if source is not None else (None, None)
         
         # Add edge if the argument has a known output node.
         if src is not None:
@@ -420,6 +583,8 @@ class FlowGraphBuilder(HasTraits):
     def _add_object_edge(self, obj, source, target, 
                          obj_id=None, sourceport=None, targetport=None):
         """ Add an edge corresponding to an object.
+        
+        Returns the key of the new edge.
         """
         context = self._stack[-1]
         graph = context.graph
@@ -430,10 +595,10 @@ class FlowGraphBuilder(HasTraits):
             data['sourceport'] = sourceport
         if targetport is not None:
             data['targetport'] = targetport
-        note = self.annotator.notate_object(obj)
+        note = self._notate_object(obj)
         if note:
             data['annotation'] = self._annotation_key(note)
-        graph.add_edge(source, target, **data)
+        return graph.add_edge(source, target, **data)
     
     def _add_object_input_node(self, obj, obj_id, node, port):
         """ Add an object as an unknown input to a node.
@@ -454,19 +619,19 @@ class FlowGraphBuilder(HasTraits):
         graph, output_table = context.graph, context.output_table
         output_node = graph.graph['output_node']
         
+        output_edge_keys = context.output_edge_keys
+        
         # Remove old output, if any.
-        if obj_id in output_table:
-            old, _ = output_table[obj_id]
-            edge_data = graph.get_edge_data(old, output_node)
-            keys = [ key for key, data in edge_data.items()
-                     if data['id'] == obj_id ]
-            assert len(keys) == 1
-            graph.remove_edge(old, output_node, key=keys[0])
+        old_output = output_table.get(obj_id)
+        if old_output is not None:
+            old, _ = old_output
+            graph.remove_edge(old, output_node,
+                              key=output_edge_keys.pop(obj_id))
         
         # Set new output.
         output_table[obj_id] = (node, port)
-        self._add_object_edge(obj, node, output_node, obj_id=obj_id,
-                              sourceport=port)
+        output_edge_keys[obj_id] = self._add_object_edge(
+            obj, node, output_node, obj_id=obj_id, sourceport=port)
         
         # The object has been created or mutated, so fetch its slots.
         if self.store_slots:
@@ -477,8 +642,22 @@ class FlowGraphBuilder(HasTraits):
         """
         context = self._stack[-1]
         graph = context.graph
-        note = self.annotator.notate_object(obj) or {}
-        for slot_index, slot_def in enumerate(note.get('slots', [])):
+        note = self._notate_object(obj) or {}
+        slot_defs = note.get('slots', [])
+        if not slot_defs:
+            return
+        
+        # Hoist lookups that do not vary across slots.
+        note_key = self._annotation_key(note)
+        get_port_data = self._get_port_data
+        add_object_edge = self._add_object_edge
+        maybe_track = self.object_tracker.maybe_track
+        self_port_data = get_port_data(event, obj, obj_id,
+            portkind='input',
+            annotation_index=1,
+        )
+        
+        for slot_index, slot_def in enumerate(slot_defs):
             slot = slot_def['slot']
             try:
                 slot_value = get_slot(obj, slot)
@@ -487,45 +666,58 @@ class FlowGraphBuilder(HasTraits):
             slot_node = self._node_name('slot:' + str(slot))
             slot_node_data = {
                 'slot': slot,
-                'annotation': self._annotation_key(note),
+                'annotation': note_key,
                 'annotation_index': slot_index+1,
                 'annotation_kind': 'slot',
-                'ports': OrderedDict([
-                    ('self', self._get_port_data(event, obj,
-                        portkind='input',
-                        annotation_index=1,
-                    )),
-                    ('return', self._get_port_data(event, slot_value,
+                'ports': _ordered_dict([
+                    ('self', dict(self_port_data)),
+                    ('return', get_port_data(event, slot_value,
                         portkind='output',
                         annotation_index=1,
                     )),
                 ])
             }
             graph.add_node(slot_node, **slot_node_data)
-            self._add_object_edge(obj, node, slot_node, obj_id=obj_id,
-                                  sourceport=port, targetport='self')
+            add_object_edge(obj, node, slot_node, obj_id=obj_id,
+                            sourceport=port, targetport='self')
             
             # If object is trackable, recursively set it as output.
-            slot_id = self.object_tracker.maybe_track(slot_value)
+            slot_id = maybe_track(slot_value)
             if slot_id:
                 self._set_object_output_node(
                     event, slot_value, slot_id, slot_node, 'return')
     
-    def _get_ports_data(self, event, names, annotation=[], extra_data={}):
+    def _get_ports_data(self, event, names, annotation=[], extra_data={},
+                        renamed=()):
         """ Get data for the ports (input or output) of a node.
+        
+        Ports named after their slot are given by `names`, while ports with
+        a different name are given by `renamed`, as (slot, port) pairs.
         """
-        ports = OrderedDict()
-        slots = _IOSlots(event)
-        annotation_table = { 
-            # Index annotations start at 1: it is language-agnostic.
-            slots._name(slot): i+1 for i, slot in enumerate(annotation)
-        }
-        for name in names:
-            name, portname = name if isinstance(name, tuple) else (name, name)
-            try:
-                obj = get_slot(slots, name)
-            except AttributeError:
-                obj = None
+        ports = _ordered_dict()
+        arguments = event.arguments
+        slots = None
+        annotation_table = {}
+        if annotation:
+            slots = _IOSlots(event)
+            annotation_table = { 
+                # Index annotations start at 1: it is language-agnostic.
+                slots._name(slot): i+1 for i, slot in enumerate(annotation)
+            }
+        for name, portname in chain(zip(names, names), renamed):
+            # Plain arguments and return values are looked up directly. Only
+            # nested slots, like multiple return values, need `get_slot`.
+            if name in arguments:
+                obj = arguments[name]
+            elif name == 'return':
+                obj = event.value
+            else:
+                if slots is None:
+                    slots = _IOSlots(event)
+                try:
+                    obj = get_slot(slots, name)
+                except AttributeError:
+                    obj = None
             
             data = self._get_port_data(event, obj, argname=name, **extra_data)
             if name in annotation_table:
@@ -533,21 +725,27 @@ class FlowGraphBuilder(HasTraits):
             ports[portname] = data
         return ports
     
-    def _get_port_data(self, event, obj, **extra_data):
+    def _get_port_data(self, event, obj, obj_id=None, **extra_data):
         """ Get data for a single port on a node.
+        
+        The object ID is looked up unless given by the caller.
         """
         data = extra_data
         if obj is None:
             return data
         
         # Add object ID if available.
-        obj_id = self.object_tracker.get_id(obj)
+        if obj_id is None:
+            obj_id = self.object_tracker.get_id(obj)
         if obj_id is not None:
             data['id'] = obj_id
         
         # Add value if the object is primitive.
         if self.is_primitive(obj):
-            data['value'] = json_clean(obj)
+            if type(obj) in _JSON_SCALAR_TYPES:
+                data['value'] = obj
+            else:
+                data['value'] = json_clean(obj)
         elif isinstance(obj, types.ModuleType):
             data['value'] = obj.__name__
 
@@ -559,17 +757,35 @@ class FlowGraphBuilder(HasTraits):
             data['qual_name'] = get_class_qual_name(obj_type)
 
         # Add object annotation, if it exists.
-        note = self.annotator.notate_object(obj)
+        note = self._notate_object(obj)
         if note:
             data['annotation'] = self._annotation_key(note)
         
         return data
     
+    def _notate_object(self, obj):
+        """ Find annotation for an object, caching it for the current event.
+        """
+        cache = self._stack[-1].annotation_cache
+        key = id(obj)
+        if key in cache:
+            return cache[key][1]
+        note = self.annotator.notate_object(obj)
+        # Keep a reference to the object so that its ID cannot be recycled.
+        cache[key] = (obj, note)
+        return note
+    
     def _annotation_key(self, note):
         """ Get a key identifying an annotation.
+        
+        The key is cached on the annotation, which is typically seen several
+        times while handling a single trace event.
         """
-        keys = ('language', 'package', 'id')
-        return '/'.join(note[key] for key in keys)
+        key = note.get('__flowgraph_key__')
+        if key is None:
+            key = note['language'] + '/' + note['package'] + '/' + note['id']
+            note['__flowgraph_key__'] = key
+        return key
     
     def _node_name(self, base):
         """ Get node name unique within flow graph, including nested graphs.
@@ -588,46 +804,79 @@ class FlowGraphBuilder(HasTraits):
         and outputs. Therefore, when an argument is mutated and hence appears as
         both an input and output, we must give the output port a different name.
         """
-        return arg_name + '!'
+        port = _MUTATED_PORT_NAMES.get(arg_name)
+        if port is None:
+            port = arg_name + '!'
+            if isinstance(port, str):
+                port = intern(port)
+            _MUTATED_PORT_NAMES[arg_name] = port
+        return port
 
 
-class _CallContext(HasTraits):
+class _CallContext(object):
     """ Context for a trace call event.
     
-    Internal state for FlowGraphBuilder.
+    Internal state for FlowGraphBuilder. A context is created for every call
+    event, so this is a plain class with slots rather than a `HasTraits`.
     """
-    # The trace call event for this call stack item.
-    event = Instance(TraceCall)
-    
-    # Name of graph node created for call, if any.
-    node = Unicode()
-    
-    # Flow graph nested in node, if any.
-    graph = Instance(nx.MultiDiGraph, allow_none=True)
-    
-    # Output table: mapping from object ID to (node, output port) pair.
-    #
-    # At any given time during execution, an object is the output of at most
-    # one node, i.e., there is at most one incoming edge to the special output
-    # node that carries a particular object. We maintain this mapping as an
-    # auxiliary data structure called the "output table". It is logically
-    # superfluous--the same information is captured by the graph topology--but
-    # it improves efficiency by allowing constant-time lookup.
-    output_table = Dict()
-
-    # Variable table: mapping from variable names to (node, output port) pair.
-    #
-    # A complement to object tracking, which doesn't work for objects that
-    # are not weak referenceable.
-    variable_table = Dict()
-
-    # Event table: mapping from trace event to (node, output port) pair.
-    #
-    # Like the variable table, the event table is only relevant for objects
-    # that can't be tracked. The dictionary has weak reference keys because we
-    # want to allow the trace events to be garbage collected once they've
-    # passed through the system.
-    event_table = Instance(WeakKeyDictionary, ())
+    
+    __slots__ = ('event', 'node', 'graph', 'annotation', 'annotation_cache',
+                 'output_table', 'output_edge_keys', 'variable_table',
+                 'event_table')
+    
+    def __init__(self, event=None, node='', graph=None, annotation=None):
+        # The trace call event for this call stack item.
+        self.event = event
+        
+        # Name of graph node created for call, if any.
+        self.node = node
+        
+        # Flow graph nested in node, if any.
+        self.graph = graph
+        
+        # Annotation of the called function, if any.
+        self.annotation = annotation if annotation is not None else {}
+        
+        # Annotation cache: mapping from memory address to (object, annotation).
+        #
+        # Objects are typically annotated several times while handling a
+        # single trace event (for edges, ports, and slots). The cache is
+        # cleared after each event, so holding strong references to the
+        # objects is harmless.
+        self.annotation_cache = {}
+        
+        # Output table: mapping from object ID to (node, output port) pair.
+        #
+        # At any given time during execution, an object is the output of at
+        # most one node, i.e., there is at most one incoming edge to the
+        # special output node that carries a particular object. We maintain
+        # this mapping as an auxiliary data structure called the "output
+        # table". It is logically superfluous--the same information is captured
+        # by the graph topology--but it improves efficiency by allowing
+        # constant-time lookup.
+        self.output_table = {}
+        
+        # Output edge keys: mapping from object ID to key of the edge carrying
+        # the object to the special output node.
+        #
+        # Complements the output table by allowing constant-time removal of the
+        # current output edge of an object.
+        self.output_edge_keys = {}
+        
+        # Variable table: mapping from variable names to (node, output port)
+        # pair.
+        #
+        # A complement to object tracking, which doesn't work for objects that
+        # are not weak referenceable.
+        self.variable_table = {}
+        
+        # Event table: mapping from trace event to (node, output port) pair.
+        #
+        # Like the variable table, the event table is only relevant for objects
+        # that can't be tracked. The dictionary has weak reference keys because
+        # we want to allow the trace events to be garbage collected once
+        # they've passed through the system.
+        self.event_table = WeakKeyDictionary()
 
 
 class _IOSlots(object):
@@ -635,18 +884,21 @@ class _IOSlots(object):
     
     Implementation detail of FlowGraphBuilder.
     """
+    
+    # Avoid a per-instance dictionary, since instances are created for most
+    # trace events. Function slots are still resolved by `__getattr__`.
+    __slots__ = ('__event', '__argument_names')
 
     def __init__(self, event):
         self.__event = event
+        self.__argument_names = tuple(event.arguments.keys())
     
     def _name(self, slot):
         """ Map the function slot (integer or string) to a string name, if any.
         """
-        event = self.__event
         if isinstance(slot, int):
-            argument_names = list(event.arguments.keys())
             try:
-                return argument_names[slot]
+                return self.__argument_names[slot]
             except IndexError:
                 return None
         return slot
@@ -661,6 +913,12 @@ class _IOSlots(object):
             raise AttributeError("No function slot %r" % name)
     
     def __getitem__(self, index):
-        event = self.__event
-        argument_names = list(event.arguments.keys())
-        return event.arguments[argument_names[index]]
+        return self.__event.arguments[self.__argument_names[index]]
+
+
+def _return_port_name(i):
+    """ Get name of output port for the i-th of multiple return values.
+    """
+    if i < len(_RETURN_PORT_NAMES):
+        return _RETURN_PORT_NAMES[i]
+    return 'return.%i' % i
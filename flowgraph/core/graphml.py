@@ -51,17 +51,18 @@ from __future__ import absolute_import
 from collections import OrderedDict
 from io import BytesIO
 import json
-try:
-    from xml.etree.cElementTree import Element
-except ImportError:
-    from xml.etree.ElementTree import Element
-
 from ipykernel.jsonutil import json_clean
 import networkx as nx
 from networkx.readwrite.graphml import GraphMLReader as BaseGraphMLReader, \
     GraphMLWriter as BaseGraphMLWriter
 from networkx.utils import open_file, make_str
 
+# Graph attributes holding defaults, which are not written as graph data.
+_GRAPH_DEFAULT_KEYS = frozenset(('node_default', 'edge_default', 'port_default'))
+
+# Edge attributes written as edge element attributes, not as edge data.
+_EDGE_PORT_KEYS = frozenset(('sourceport', 'targetport'))
+
 
 @open_file(1, mode='wb')
 def write_graphml(graph, path, **kwargs):
@@ -127,11 +128,11 @@ class GraphMLWriter(BaseGraphMLWriter):
         """
         # XXX: Mostly copied from base class `add_graph_element()`.
         default_edge_type = 'directed' if graph.is_directed() else 'undirected'
-        graph_element = Element('graph', edgedefault=default_edge_type)
+        graph_element = self.myElement('graph', edgedefault=default_edge_type)
         
         default = {}
         data = { k:v for k,v in graph.graph.items()
-                 if k not in ['node_default','edge_default','port_default'] }
+                 if k not in _GRAPH_DEFAULT_KEYS }
         self.add_attributes('graph', graph_element, data, default)
         self.add_nodes(graph, graph_element, parent_node)
         self.add_edges(graph, graph_element, parent_node)
@@ -141,44 +142,51 @@ class GraphMLWriter(BaseGraphMLWriter):
         """ Reimplemented to support nested graphs.
         """
         for node, data in graph.nodes(data=True):
-            # If the node is a reference to the parent graph, skip it.
-            # It has already been added.
-            if self.is_parent_reference(graph, node):
-                if parent_node is None:
-                    msg = "Node {} references non-existent parent node"
-                    raise nx.NetworkXError(msg.format(node))
-                continue
-            
-            # Check global uniqueness of node IDs, per GraphML spec.
-            node_id = make_str(node)
-            if node_id in self.all_nodes:
-                msg = "Duplicate node ID '{}' not allowed in GraphML"
-                raise nx.NetworkXError(msg.format(node_id))
-            self.all_nodes.add(node_id)
-            
-            # Add node data.
-            node_element = Element('node', id=node_id)
-            default = graph.graph.get('node_default', {})
-            self.add_attributes('node', node_element, data, default)
-            
-            # Add node ports, if any.
-            ports = data.get('ports', {})
-            default = graph.graph.get('port_default', {})
-            self.add_ports(node_element, ports, default)
-            
-            # Add nested graph for node, if any.
-            nested = data.get('graph')
-            if nested and isinstance(nested, nx.Graph):
-                nested_element = self.add_graph(nested, parent_node=node)
-                node_element.append(nested_element)
-            
-            graph_element.append(node_element)
+            node_element = self.add_node(graph, node, data, parent_node)
+            if node_element is not None:
+                graph_element.append(node_element)
+    
+    def add_node(self, graph, node, data, parent_node=None):
+        """ Create a <node> element, or None if the node references the parent.
+        """
+        # If the node is a reference to the parent graph, skip it.
+        # It has already been added.
+        if self.is_parent_reference(graph, node):
+            if parent_node is None:
+                msg = "Node {} references non-existent parent node"
+                raise nx.NetworkXError(msg.format(node))
+            return None
+        
+        # Check global uniqueness of node IDs, per GraphML spec.
+        node_id = make_str(node)
+        if node_id in self.all_nodes:
+            msg = "Duplicate node ID '{}' not allowed in GraphML"
+            raise nx.NetworkXError(msg.format(node_id))
+        self.all_nodes.add(node_id)
+        
+        # Add node data.
+        node_element = self.myElement('node', id=node_id)
+        default = graph.graph.get('node_default', {})
+        self.add_attributes('node', node_element, data, default)
+        
+        # Add node ports, if any.
+        ports = data.get('ports', {})
+        default = graph.graph.get('port_default', {})
+        self.add_ports(node_element, ports, default)
+        
+        # Add nested graph for node, if any.
+        nested = data.get('graph')
+        if nested and isinstance(nested, nx.Graph):
+            nested_element = self.add_graph(nested, parent_node=node)
+            node_element.append(nested_element)
+        
+        return node_element
     
     def add_ports(self, node_element, ports, default):
         """ Add ports to a <node> element in GraphML.
         """
         for name, data in ports.items():
-            port_element = Element('port', name=name)
+            port_element = self.myElement('port', name=name)
             self.add_attributes('port', port_element, data, default)
             node_element.append(port_element)
     
@@ -191,29 +199,35 @@ class GraphMLWriter(BaseGraphMLWriter):
         """
         default = graph.graph.get('edge_default', {})
         for u,v,data in graph.edges(data=True):
-            source = parent_node if self.is_parent_reference(graph, u) else u
-            target = parent_node if self.is_parent_reference(graph, v) else v
-            edge_element = Element('edge',
-                source=make_str(source), target=make_str(target))
-            
-            sourceport = data.get('sourceport')
-            if sourceport is not None:
-                edge_element.set('sourceport', sourceport)
-            
-            targetport = data.get('targetport')
-            if targetport is not None:
-                edge_element.set('targetport', targetport)
-            
-            self.add_attributes('edge', edge_element, data, default)
+            edge_element = self.add_edge(graph, u, v, data, default, parent_node)
             graph_element.append(edge_element)
     
+    def add_edge(self, graph, u, v, data, default, parent_node=None):
+        """ Create an <edge> element.
+        """
+        source = parent_node if self.is_parent_reference(graph, u) else u
+        target = parent_node if self.is_parent_reference(graph, v) else v
+        edge_element = self.myElement('edge',
+            source=make_str(source), target=make_str(target))
+        
+        sourceport = data.get('sourceport')
+        if sourceport is not None:
+            edge_element.set('sourceport', sourceport)
+        
+        targetport = data.get('targetport')
+        if targetport is not None:
+            edge_element.set('targetport', targetport)
+        
+        self.add_attributes('edge', edge_element, data, default)
+        return edge_element
+    
     def add_attributes(self, scope, xml_obj, data, default):
         """ Reimplemented to skip special attributes (nested graph, ports).
         """
         for k,v in data.items():
             if (scope == 'node' and k == 'graph' and isinstance(v, nx.Graph)) or \
                (scope == 'node' and k == 'ports') or \
-               (scope == 'edge' and k in ('sourceport', 'targetport')):
+               (scope == 'edge' and k in _EDGE_PORT_KEYS):
                 continue
             # Copied from superclass, with one change to avoid premature
             # string coercion of the value.
@@ -238,7 +252,7 @@ class GraphMLWriter(BaseGraphMLWriter):
         xml_type = self.xml_type[element_type]
 
         key_id = self.get_key(name, xml_type, scope, default)
-        data_element = Element('data', key=key_id)
+        data_element = self.myElement('data', key=key_id)
         if xml_type == 'json':
             data_element.text = json.dumps(value)
         else:
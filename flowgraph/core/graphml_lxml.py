@@ -0,0 +1,116 @@
+# Copyright 2018 IBM Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Streaming GraphML writer based on lxml.
+
+This module is an optional accelerator for `graphml.write_graphml_str`. It
+writes the same GraphML dialect, but instead of building the XML tree for the
+whole document, it streams the graph, including nested graphs, one node or
+edge at a time using `lxml.etree.xmlfile`. Importing this module raises
+`ImportError` if lxml is not installed.
+
+Unlike ElementTree, lxml refuses to write strings that are not XML compatible,
+such as strings containing control characters, and raises `ValueError`.
+Callers should fall back to `graphml.write_graphml_str` in that case.
+"""
+from __future__ import absolute_import
+
+from io import BytesIO
+
+from lxml import etree
+import networkx as nx
+
+from .graphml import GraphMLWriter, _GRAPH_DEFAULT_KEYS
+
+
+def write_graphml_str_lxml(graph, prettyprint=False, **kwargs):
+    """ Write graph to a GraphML string, streaming with lxml.
+
+    Accepts the same arguments as `graphml.write_graphml_str`, except that
+    pretty-printing is not supported.
+    """
+    if prettyprint:
+        raise ValueError("Streaming GraphML writer does not pretty-print")
+    writer = StreamingGraphMLWriter(**kwargs)
+    return writer.write_graph(graph).decode(writer.encoding)
+
+
+class StreamingGraphMLWriter(GraphMLWriter):
+    """ GraphML writer that streams graphs using lxml.
+    """
+
+    def __init__(self, **kwargs):
+        super(StreamingGraphMLWriter, self).__init__(**kwargs)
+        self.myElement = etree.Element
+        # Holds the <key> elements, which are written before the graph.
+        self.xml = etree.Element('graphml')
+
+    def write_graph(self, graph):
+        """ Write a GraphML document containing the graph, as bytes.
+        """
+        # GraphML requires the keys to precede the graph, but the keys are
+        # only known after the graph is written, so stream the graph first.
+        body = BytesIO()
+        with etree.xmlfile(body, encoding=self.encoding) as xf:
+            self.write_graph_element(xf, graph)
+
+        header = ('<?xml version=\'1.0\' encoding=\'{encoding}\'?>\n'
+                  '<graphml xmlns="{ns}" xmlns:xsi="{xsi}" '
+                  'xsi:schemaLocation="{schema}">').format(
+            encoding=self.encoding, ns=self.NS_GRAPHML, xsi=self.NS_XSI,
+            schema=self.SCHEMALOCATION)
+        parts = [ header.encode(self.encoding) ]
+        parts.extend(etree.tostring(key, encoding=self.encoding)
+                     for key in self.xml)
+        parts.append(body.getvalue())
+        parts.append(b'</graphml>')
+        return b''.join(parts)
+
+    def write_graph_element(self, xf, graph, parent_node=None):
+        """ Stream a graph element (top-level or nested) to an `xmlfile`.
+        """
+        default_edge_type = 'directed' if graph.is_directed() else 'undirected'
+        with xf.element('graph', edgedefault=default_edge_type):
+            graph_element = self.myElement('graph')
+            data = { k:v for k,v in graph.graph.items()
+                     if k not in _GRAPH_DEFAULT_KEYS }
+            self.add_attributes('graph', graph_element, data, {})
+            for data_element in graph_element:
+                xf.write(data_element)
+
+            for node, data in graph.nodes(data=True):
+                self.write_node_element(xf, graph, node, data, parent_node)
+
+            default = graph.graph.get('edge_default', {})
+            for u,v,data in graph.edges(data=True):
+                xf.write(self.add_edge(graph, u, v, data, default, parent_node))
+
+    def write_node_element(self, xf, graph, node, data, parent_node=None):
+        """ Stream a node element, and its nested graph, to an `xmlfile`.
+        """
+        nested = data.get('graph')
+        if not (nested and isinstance(nested, nx.Graph)):
+            node_element = self.add_node(graph, node, data, parent_node)
+            if node_element is not None:
+                xf.write(node_element)
+            return
+
+        # Build the node's data and ports, then stream its nested graph.
+        data = { k:v for k,v in data.items() if k != 'graph' }
+        node_element = self.add_node(graph, node, data, parent_node)
+        if node_element is not None:
+            with xf.element('node', node_element.attrib):
+                for child in node_element:
+                    xf.write(child)
+                self.write_graph_element(xf, nested, parent_node=node)
@@ -29,5 +29,7 @@ def find_node(graph, query, **kwargs):
 def find_nodes(graph, query, data=False):
     """ Iterator over all nodes matching the data query.
     """
-    return ((v, graph.nodes[v]) if data else v 
-            for v in graph if query(graph.nodes[v]))
+    items = graph.nodes(data=True)
+    if data:
+        return ((v, d) for v, d in items if query(d))
+    return (v for v, d in items if query(d))
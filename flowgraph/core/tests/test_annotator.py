@@ -18,16 +18,23 @@ from pathlib2 import Path
 import unittest
 
 from . import objects
+from ..annotation_db import AnnotationDB
 from ..annotator import Annotator
 
 
 class TestAnnotator(unittest.TestCase):
     
-    def setUp(self):
+    @classmethod
+    def setUpClass(cls):
+        """ Load the annotation DB once, to be shared by all tests.
+        """
         objects_path = Path(objects.__file__).parent
         json_path = objects_path.joinpath('data', 'annotations.json')
-        self.annotator = Annotator()
-        self.annotator.db.load_file(json_path)
+        cls.db = AnnotationDB()
+        cls.db.load_file(json_path)
+    
+    def setUp(self):
+        self.annotator = Annotator(db=self.db)
     
     def test_function(self):
         """ Can we notate a function?
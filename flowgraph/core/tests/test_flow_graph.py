@@ -14,77 +14,161 @@
 
 from __future__ import absolute_import
 
-from collections import OrderedDict
+from collections import Counter, OrderedDict
+from operator import itemgetter
 from pathlib2 import Path
 import six
 from textwrap import dedent
 import unittest
 
 import networkx as nx
-import networkx.algorithms.isomorphism as iso
 
 from ..annotation_db import AnnotationDB
 from ..flow_graph import new_flow_graph, flatten, join, \
     flow_graph_to_graphml, flow_graph_from_graphml
+from ..flow_graph_builder import FlowGraphBuilder
 from ..graphutil import find_node
 from ..graphml import read_graphml_str, write_graphml_str
 from ..record import record_code
 from ...trace.object_tracker import ObjectTracker
+from ...trace.tracer import Tracer
 from . import objects
 
 
 class TestFlowGraph(unittest.TestCase):
     """ Tests for Python flow graph machinery.
     """
+    
+    # The class fixtures are independent of the tests, so the tests can be
+    # distributed across processes, e.g., `nosetests --processes=N`.
+    _multiprocess_can_split_ = True
 
     @classmethod
     def setUpClass(cls):
-        """ Set up the annotation DB and object tracker.
+        """ Set up the annotation DB, object tracker, builder, and tracer.
+        
+        The builder and tracer are shared by all tests and reset before each
+        recording, as in `record_code`.
         """
         objects_path = Path(objects.__file__).parent
         json_path = objects_path.joinpath('data', 'annotations.json')
         cls.db = AnnotationDB()
         cls.db.load_file(str(json_path))
         cls.object_tracker = ObjectTracker()
-
-    def record(self, code, env=None, **kwargs):
+        
+        cls.builder = FlowGraphBuilder(object_tracker=cls.object_tracker)
+        cls.builder.annotator.db = cls.db
+        cls.tracer = Tracer()
+        
+        # Target flow graphs shared by several tests. Edges name the variable
+        # holding their object, to be resolved to an ID by `from_template`.
+        target = new_flow_graph()
+        outputs = target.graph['output_node']
+        target.add_nodes_from([
+            ('1', { 'qual_name': 'Foo' }),
+            ('2', { 'qual_name': 'bar_from_foo' }),
+        ])
+        target.add_edges_from([
+            ('1', '2', {
+                'var': 'foo',
+                'sourceport': 'return',
+                'targetport': 'foo',
+            }),
+            ('1', outputs, { 'var': 'foo', 'sourceport': 'return' }),
+            ('2', outputs, { 'var': 'bar', 'sourceport': 'return' }),
+        ])
+        cls.templates = { 'two_object_flow': target }
+    
+    def setUp(self):
+        self.ids = {}
+        self.qual_name_index = {}
+    
+    def record(self, code, env=None, store_slots=True):
         """ Record block of code for test.
         """
         self.env = env if env is not None else {}
         self.env.update(dict(objects=objects))
-        return record_code(dedent(code), db=self.db, env=self.env, 
-                                  object_tracker=self.object_tracker, **kwargs)
+        self.ids = {}
+        self.builder.reset()
+        self.builder.store_slots = store_slots
+        self.tracer.observe(self.builder.push_change, 'event')
+        try:
+            self.tracer.trace(dedent(code), env=self.env)
+        finally:
+            self.tracer.unobserve(self.builder.push_change, 'event')
+        return self.builder.graph
     
-    def id(self, name):
+    def id(self, name=None):
         """ Convenience method to get ID for tracked object.
+        
+        Without a name, returns the test ID, as `unittest.TestCase.id` does,
+        since test runners like nose's multiprocess plugin rely on it.
+        
+        IDs are memoized until the next recording.
+        """
+        if name is None:
+            return super(TestFlowGraph, self).id()
+        obj_id = self.ids.get(name)
+        if obj_id is None:
+            obj_id = self.object_tracker.get_id(self.env[name])
+            self.ids[name] = obj_id
+        return obj_id
+    
+    def node_by_qual_name(self, graph, qual_name):
+        """ Convenience method to find the first node with given qualified name.
+        
+        The nodes of a graph are indexed by qualified name on the first lookup.
+        """
+        # Key by ID but hold onto the graph, so that the ID is not reused.
+        _, index = self.qual_name_index.get(id(graph), (None, None))
+        if index is None:
+            index = {}
+            for node, data in graph.nodes(data=True):
+                index.setdefault(data.get('qual_name'), node)
+            self.qual_name_index[id(graph)] = (graph, index)
+        return index.get(qual_name)
+    
+    def from_template(self, name):
+        """ Copy a target flow graph template, filling in the object IDs.
         """
-        obj = self.env[name]
-        return self.object_tracker.get_id(obj)
+        target = self.templates[name].copy()
+        for _, _, data in target.edges(data=True):
+            if 'var' in data:
+                data['id'] = self.id(data.pop('var'))
+        return target
     
     def assert_isomorphic(self, g1, g2, check_id=True):
         """ Assert that two flow graphs are isomorphic.
         """
-        node_attrs = [ 'qual_name', 'slot' ]
-        node_defaults = [ None ] * len(node_attrs)
-        if check_id:
-            edge_attrs = [ 'id', 'sourceport', 'targetport' ]
-        else:
-            edge_attrs = [ 'sourceport', 'targetport' ]
-        edge_defaults = [ None ] * len(edge_attrs)
+        # Compare canonical forms when the nodes are uniquely labeled, which
+        # is linear in the size of the graphs. Otherwise fall back to VF2.
+        c1, c2 = _canonical(g1, check_id), _canonical(g2, check_id)
+        if c1 is not None and c2 is not None:
+            self.assertEqual(c1, c2)
+            return
         
-        node_match = iso.categorical_node_match(node_attrs, node_defaults)
-        edge_match = iso.categorical_multiedge_match(edge_attrs, edge_defaults)
+        # Extract the compared attributes once per node and edge, so that the
+        # matchers called by VF2 only compare tuples.
+        get_key = itemgetter('match_key')
+        def node_match(data1, data2):
+            return get_key(data1) == get_key(data2)
+        def edge_match(datasets1, datasets2):
+            return set(map(get_key, datasets1.values())) == \
+                set(map(get_key, datasets2.values()))
         self.assertTrue(nx.is_isomorphic(
-            g1, g2, node_match=node_match, edge_match=edge_match))
+            _keyed(g1, check_id), _keyed(g2, check_id),
+            node_match=node_match, edge_match=edge_match))
     
     def get_ports(self, graph, node, portkind=None):
         """ Convenience method to get ports from node in flow graph.
         """
         ports = graph.nodes[node]['ports']
-        if portkind is not None:
-            ports = OrderedDict((p, data) for p, data in ports.items()
-                                if data['portkind'] == portkind)
-        return ports
+        if portkind is None:
+            return ports
+        # Filter into the same mapping type as the builder's, which is a plain
+        # dict wherever dicts preserve insertion order.
+        return type(ports)((p, data) for p, data in ports.items()
+                           if data['portkind'] == portkind)
     
     def test_two_object_flow(self):
         """ Check a simple, two-object flow.
@@ -94,16 +178,58 @@ class TestFlowGraph(unittest.TestCase):
             bar = objects.bar_from_foo(foo)
         """)
         
-        target = new_flow_graph()
-        outputs = target.graph['output_node']
-        target.add_node('1', qual_name='Foo')
-        target.add_node('2', qual_name='bar_from_foo')
-        target.add_edge('1', '2', id=self.id('foo'),
-                        sourceport='return', targetport='foo')
-        target.add_edge('1', outputs, id=self.id('foo'), sourceport='return')
-        target.add_edge('2', outputs, id=self.id('bar'), sourceport='return')
+        target = self.from_template('two_object_flow')
         self.assert_isomorphic(actual, target)
     
+    def test_record_code(self):
+        """ Check that `record_code` records the same flow as the shared
+        builder and tracer.
+        """
+        code = """
+            foo = objects.Foo()
+            bar = objects.bar_from_foo(foo)
+        """
+        target = self.record(code)
+        actual = record_code(dedent(code), db=self.db, env=self.env,
+                             object_tracker=self.object_tracker)
+        self.assert_isomorphic(actual, target, check_id=False)
+    
+    def test_graph_version(self):
+        """ Check that the graph version changes only when the graph may have
+        changed.
+        """
+        self.record("foo = objects.Foo()")
+        version = self.builder.graph_version
+        self.assertEqual(self.builder.graph_version, version)
+        
+        self.builder.reset()
+        self.assertNotEqual(self.builder.graph_version, version)
+        version, graph = self.builder.graph_version, self.builder.graph
+        self.builder.reset()
+        self.assertEqual(self.builder.graph_version, version)
+        
+        # Even so, a reset never hands back a graph that escaped earlier.
+        graph.graph['junk'] = True
+        self.builder.reset()
+        self.assertIsNot(self.builder.graph, graph)
+        self.assertNotIn('junk', self.builder.graph.graph)
+        self.assertEqual(len(self.builder.graph), len(graph))
+    
+    def test_graph_frozen(self):
+        """ Check that the shared copy of the flow graph cannot be modified,
+        unlike a copy from `copy_graph`.
+        """
+        graph = self.record("foo = objects.Foo()")
+        self.assertTrue(nx.is_frozen(graph))
+        self.assertRaises(nx.NetworkXError, graph.add_node, 'junk')
+        self.assertFalse(nx.is_frozen(graph.copy()))
+        
+        copy = self.builder.copy_graph()
+        self.assertFalse(nx.is_frozen(copy))
+        copy.add_node('junk')
+        self.assertNotIn('junk', self.builder.graph)
+        self.assertNotIn('junk', self.builder.copy_graph())
+    
     def test_two_object_flow_external(self):
         """ Check a simple, two-object flow with input from external object.
         """
@@ -115,8 +241,10 @@ class TestFlowGraph(unittest.TestCase):
         target = new_flow_graph()
         inputs, outputs = target.graph['input_node'], target.graph['output_node']
         target.add_node('1', qual_name='bar_from_foo')
-        target.add_edge(inputs, '1', id=self.id('foo'), targetport='foo')
-        target.add_edge('1', outputs, id=self.id('bar'), sourceport='return')
+        target.add_edges_from([
+            (inputs, '1', { 'id': self.id('foo'), 'targetport': 'foo' }),
+            ('1', outputs, { 'id': self.id('bar'), 'sourceport': 'return' }),
+        ])
         self.assert_isomorphic(actual, target)
     
     def test_two_object_flow_untrackable_compose(self):
@@ -125,8 +253,10 @@ class TestFlowGraph(unittest.TestCase):
         """
         actual = self.record("x = sum(range(5))")
         target = new_flow_graph()
-        target.add_node('range', qual_name='range')
-        target.add_node('sum', qual_name='sum')
+        target.add_nodes_from([
+            ('range', { 'qual_name': 'range' }),
+            ('sum', { 'qual_name': 'sum' }),
+        ])
         target.add_edge('range', 'sum', sourceport='return',
                         targetport='iterable' if six.PY3 else '0')
         self.assert_isomorphic(actual, target)
@@ -142,16 +272,26 @@ class TestFlowGraph(unittest.TestCase):
         
         target = new_flow_graph()
         outputs = target.graph['output_node']
-        target.add_node('1', qual_name='Foo')
-        target.add_node('2', qual_name='bar_from_foo')
-        target.add_node('3', qual_name='baz_from_bar')
-        target.add_edge('1', '2', id=self.id('foo'),
-                        sourceport='return', targetport='foo')
-        target.add_edge('2', '3', id=self.id('bar'),
-                        sourceport='return', targetport='bar')
-        target.add_edge('1', outputs, id=self.id('foo'), sourceport='return')
-        target.add_edge('2', outputs, id=self.id('bar'), sourceport='return')
-        target.add_edge('3', outputs, id=self.id('baz'), sourceport='return')
+        target.add_nodes_from([
+            ('1', { 'qual_name': 'Foo' }),
+            ('2', { 'qual_name': 'bar_from_foo' }),
+            ('3', { 'qual_name': 'baz_from_bar' }),
+        ])
+        target.add_edges_from([
+            ('1', '2', {
+                'id': self.id('foo'),
+                'sourceport': 'return',
+                'targetport': 'foo',
+            }),
+            ('2', '3', {
+                'id': self.id('bar'),
+                'sourceport': 'return',
+                'targetport': 'bar',
+            }),
+            ('1', outputs, { 'id': self.id('foo'), 'sourceport': 'return' }),
+            ('2', outputs, { 'id': self.id('bar'), 'sourceport': 'return' }),
+            ('3', outputs, { 'id': self.id('baz'), 'sourceport': 'return' }),
+        ])
         self.assert_isomorphic(actual, target)
     
     def test_nonpure_flow(self):
@@ -165,16 +305,26 @@ class TestFlowGraph(unittest.TestCase):
         
         target = new_flow_graph()
         outputs = target.graph['output_node']
-        target.add_node('1', qual_name='Foo')
-        target.add_node('2', qual_name='bar_from_foo_mutating')
-        target.add_node('3', qual_name='baz_from_foo')
-        target.add_edge('1', '2', id=self.id('foo'),
-                        sourceport='return', targetport='foo')
-        target.add_edge('2', '3', id=self.id('foo'),
-                        sourceport='foo!', targetport='foo')
-        target.add_edge('2', outputs, id=self.id('foo'), sourceport='foo!')
-        target.add_edge('2', outputs, id=self.id('bar'), sourceport='return')
-        target.add_edge('3', outputs, id=self.id('baz'), sourceport='return')
+        target.add_nodes_from([
+            ('1', { 'qual_name': 'Foo' }),
+            ('2', { 'qual_name': 'bar_from_foo_mutating' }),
+            ('3', { 'qual_name': 'baz_from_foo' }),
+        ])
+        target.add_edges_from([
+            ('1', '2', {
+                'id': self.id('foo'),
+                'sourceport': 'return',
+                'targetport': 'foo',
+            }),
+            ('2', '3', {
+                'id': self.id('foo'),
+                'sourceport': 'foo!',
+                'targetport': 'foo',
+            }),
+            ('2', outputs, { 'id': self.id('foo'), 'sourceport': 'foo!' }),
+            ('2', outputs, { 'id': self.id('bar'), 'sourceport': 'return' }),
+            ('3', outputs, { 'id': self.id('baz'), 'sourceport': 'return' }),
+        ])
         self.assert_isomorphic(actual, target)
     
     def test_pure_flow(self):
@@ -188,16 +338,26 @@ class TestFlowGraph(unittest.TestCase):
         
         target = new_flow_graph()
         outputs = target.graph['output_node']
-        target.add_node('1', qual_name='Foo')
-        target.add_node('2', qual_name='bar_from_foo')
-        target.add_node('3', qual_name='baz_from_foo')
-        target.add_edge('1', '2', id=self.id('foo'),
-                        sourceport='return', targetport='foo')
-        target.add_edge('1', '3', id=self.id('foo'),
-                        sourceport='return', targetport='foo')
-        target.add_edge('1', outputs, id=self.id('foo'), sourceport='return')
-        target.add_edge('2', outputs, id=self.id('bar'), sourceport='return')
-        target.add_edge('3', outputs, id=self.id('baz'), sourceport='return')
+        target.add_nodes_from([
+            ('1', { 'qual_name': 'Foo' }),
+            ('2', { 'qual_name': 'bar_from_foo' }),
+            ('3', { 'qual_name': 'baz_from_foo' }),
+        ])
+        target.add_edges_from([
+            ('1', '2', {
+                'id': self.id('foo'),
+                'sourceport': 'return',
+                'targetport': 'foo',
+            }),
+            ('1', '3', {
+                'id': self.id('foo'),
+                'sourceport': 'return',
+                'targetport': 'foo',
+            }),
+            ('1', outputs, { 'id': self.id('foo'), 'sourceport': 'return' }),
+            ('2', outputs, { 'id': self.id('bar'), 'sourceport': 'return' }),
+            ('3', outputs, { 'id': self.id('baz'), 'sourceport': 'return' }),
+        ])
         self.assert_isomorphic(actual, target)
     
     def test_class_methods(self):
@@ -230,15 +390,19 @@ class TestFlowGraph(unittest.TestCase):
         target.add_edge('1', outputs, id=self.id('bar'), sourceport='return')
         self.assert_isomorphic(actual, target)
         
-        node = find_node(actual, lambda n: n.get('qual_name') == 'outer_bar')
+        node = self.node_by_qual_name(actual, 'outer_bar')
         actual_sub = actual.nodes[node]['graph']
         target_sub = new_flow_graph()
         outputs = target_sub.graph['output_node']
-        target_sub.add_node('1', qual_name='Foo')
-        target_sub.add_node('2', qual_name='bar_from_foo')
-        target_sub.add_edge('1', '2', sourceport='return', targetport='foo')
-        target_sub.add_edge('1', outputs, sourceport='return')
-        target_sub.add_edge('2', outputs, sourceport='return')
+        target_sub.add_nodes_from([
+            ('1', { 'qual_name': 'Foo' }),
+            ('2', { 'qual_name': 'bar_from_foo' }),
+        ])
+        target_sub.add_edges_from([
+            ('1', '2', { 'sourceport': 'return', 'targetport': 'foo' }),
+            ('1', outputs, { 'sourceport': 'return' }),
+            ('2', outputs, { 'sourceport': 'return' }),
+        ])
         self.assert_isomorphic(actual_sub, target_sub, check_id=False)
     
     def test_flatten_singly_nested(self):
@@ -255,10 +419,14 @@ class TestFlowGraph(unittest.TestCase):
         actual = flatten(graph)
         target = new_flow_graph()
         outputs = target.graph['output_node']
-        target.add_node('1', qual_name='Foo')
-        target.add_node('2', qual_name='bar_from_foo')
-        target.add_edge('1', '2', sourceport='return', targetport='foo')
-        target.add_edge('2', outputs, sourceport='return')
+        target.add_nodes_from([
+            ('1', { 'qual_name': 'Foo' }),
+            ('2', { 'qual_name': 'bar_from_foo' }),
+        ])
+        target.add_edges_from([
+            ('1', '2', { 'sourceport': 'return', 'targetport': 'foo' }),
+            ('2', outputs, { 'sourceport': 'return' }),
+        ])
         self.assert_isomorphic(actual, target, check_id=False)
     
     def test_doubly_nested(self):
@@ -277,32 +445,43 @@ class TestFlowGraph(unittest.TestCase):
         
         target = new_flow_graph()
         outputs = target.graph['output_node']
-        target.add_node('1', qual_name='Foo')
-        target.add_node('2', qual_name='outer_bar_from_foo')
-        target.add_edge('1', '2', id=self.id('foo'),
-                        sourceport='return', targetport='foo')
-        target.add_edge('1', outputs, id=self.id('foo'), sourceport='return')
-        target.add_edge('2', outputs, id=self.id('bar'), sourceport='return')
+        target.add_nodes_from([
+            ('1', { 'qual_name': 'Foo' }),
+            ('2', { 'qual_name': 'outer_bar_from_foo' }),
+        ])
+        target.add_edges_from([
+            ('1', '2', {
+                'id': self.id('foo'),
+                'sourceport': 'return',
+                'targetport': 'foo',
+            }),
+            ('1', outputs, { 'id': self.id('foo'), 'sourceport': 'return' }),
+            ('2', outputs, { 'id': self.id('bar'), 'sourceport': 'return' }),
+        ])
         self.assert_isomorphic(actual, target)
         
-        node = find_node(actual, lambda n: n.get('qual_name') == 'outer_bar_from_foo')
+        node = self.node_by_qual_name(actual, 'outer_bar_from_foo')
         actual_sub1 = actual.nodes[node]['graph']
         target_sub1 = new_flow_graph()
         inputs = target_sub1.graph['input_node']
         outputs = target_sub1.graph['output_node']
         target_sub1.add_node('1', qual_name='inner_bar_from_foo')
-        target_sub1.add_edge(inputs, '1', id=self.id('foo'), targetport='foo')
-        target_sub1.add_edge('1', outputs, id=self.id('bar'), sourceport='return')
+        target_sub1.add_edges_from([
+            (inputs, '1', { 'id': self.id('foo'), 'targetport': 'foo' }),
+            ('1', outputs, { 'id': self.id('bar'), 'sourceport': 'return' }),
+        ])
         self.assert_isomorphic(actual_sub1, target_sub1)
         
-        node = find_node(actual_sub1, lambda n: n.get('qual_name') == 'inner_bar_from_foo')
+        node = self.node_by_qual_name(actual_sub1, 'inner_bar_from_foo')
         actual_sub2 = actual_sub1.nodes[node]['graph']
         target_sub2 = new_flow_graph()
         inputs = target_sub2.graph['input_node']
         outputs = target_sub2.graph['output_node']
         target_sub2.add_node('1', qual_name='bar_from_foo')
-        target_sub2.add_edge(inputs, '1', id=self.id('foo'), targetport='foo')
-        target_sub2.add_edge('1', outputs, id=self.id('bar'), sourceport='return')
+        target_sub2.add_edges_from([
+            (inputs, '1', { 'id': self.id('foo'), 'targetport': 'foo' }),
+            ('1', outputs, { 'id': self.id('bar'), 'sourceport': 'return' }),
+        ])
         self.assert_isomorphic(actual_sub2, target_sub2)
     
     def test_flatten_doubly_nested(self):
@@ -320,15 +499,14 @@ class TestFlowGraph(unittest.TestCase):
         """)
             
         actual = flatten(graph)
-        target = new_flow_graph()
-        outputs = target.graph['output_node']
-        target.add_node('1', qual_name='Foo')
-        target.add_node('2', qual_name='bar_from_foo')
-        target.add_edge('1', '2', id=self.id('foo'),
-                        sourceport='return', targetport='foo')
-        target.add_edge('1', outputs, id=self.id('foo'), sourceport='return')
-        target.add_edge('2', outputs, id=self.id('bar'), sourceport='return')
+        target = self.from_template('two_object_flow')
         self.assert_isomorphic(actual, target)
+        
+        # Flattening a copy leaves the nested graphs intact.
+        node = self.node_by_qual_name(graph, 'outer_bar_from_foo')
+        subgraph = graph.nodes[node]['graph']
+        node = self.node_by_qual_name(subgraph, 'inner_bar_from_foo')
+        self.assertIn('graph', subgraph.nodes[node])
     
     def test_attributes_methods(self):
         """ Test that attribute accesses and method calls are recorded.
@@ -343,20 +521,36 @@ class TestFlowGraph(unittest.TestCase):
         
         target = new_flow_graph()
         outputs = target.graph['output_node']
-        target.add_node('1', qual_name='Foo')
-        target.add_node('x', qual_name='getattr', slot='x')
-        target.add_node('y', qual_name='getattr', slot='y')
-        target.add_node('sum', qual_name='Foo.do_sum')
-        target.add_node('prod', qual_name='Foo.do_prod')
-        target.add_edge('1', 'x', id=self.id('foo'),
-                        sourceport='return', targetport='0')
-        target.add_edge('1', 'y', id=self.id('foo'),
-                        sourceport='return', targetport='0')
-        target.add_edge('1', 'sum', id=self.id('foo'),
-                        sourceport='return', targetport='self')
-        target.add_edge('1', 'prod', id=self.id('foo'),
-                        sourceport='return', targetport='self')
-        target.add_edge('1', outputs, id=self.id('foo'), sourceport='return')
+        target.add_nodes_from([
+            ('1', { 'qual_name': 'Foo' }),
+            ('x', { 'qual_name': 'getattr', 'slot': 'x' }),
+            ('y', { 'qual_name': 'getattr', 'slot': 'y' }),
+            ('sum', { 'qual_name': 'Foo.do_sum' }),
+            ('prod', { 'qual_name': 'Foo.do_prod' }),
+        ])
+        target.add_edges_from([
+            ('1', 'x', {
+                'id': self.id('foo'),
+                'sourceport': 'return',
+                'targetport': '0',
+            }),
+            ('1', 'y', {
+                'id': self.id('foo'),
+                'sourceport': 'return',
+                'targetport': '0',
+            }),
+            ('1', 'sum', {
+                'id': self.id('foo'),
+                'sourceport': 'return',
+                'targetport': 'self',
+            }),
+            ('1', 'prod', {
+                'id': self.id('foo'),
+                'sourceport': 'return',
+                'targetport': 'self',
+            }),
+            ('1', outputs, { 'id': self.id('foo'), 'sourceport': 'return' }),
+        ])
         self.assert_isomorphic(actual, target)
     
     def test_higher_order_function(self):
@@ -369,11 +563,18 @@ class TestFlowGraph(unittest.TestCase):
         
         target = new_flow_graph()
         outputs = target.graph['output_node']
-        target.add_node('1', qual_name='Foo')
-        target.add_node('2', qual_name='Foo.apply')
-        target.add_edge('1', '2', id=self.id('foo'),
-                        sourceport='return', targetport='self')
-        target.add_edge('1', outputs, id=self.id('foo'), sourceport='return')
+        target.add_nodes_from([
+            ('1', { 'qual_name': 'Foo' }),
+            ('2', { 'qual_name': 'Foo.apply' }),
+        ])
+        target.add_edges_from([
+            ('1', '2', {
+                'id': self.id('foo'),
+                'sourceport': 'return',
+                'targetport': 'self',
+            }),
+            ('1', outputs, { 'id': self.id('foo'), 'sourceport': 'return' }),
+        ])
         self.assert_isomorphic(actual, target)
     
     def test_module_instance(self):
@@ -388,7 +589,7 @@ class TestFlowGraph(unittest.TestCase):
                         sourceport='return')
         self.assert_isomorphic(actual, target)
 
-        node = find_node(actual, lambda n: n.get('qual_name') == 'getattr')
+        node = self.node_by_qual_name(actual, 'getattr')
         port_data = actual.nodes[node]['ports']['0']
         self.assertEqual(port_data['qual_name'], 'module')
         self.assertEqual(port_data['value'], objects.__name__)
@@ -414,13 +615,17 @@ class TestFlowGraph(unittest.TestCase):
 
         target = new_flow_graph()
         outputs = target.graph['output_node']
-        target.add_node('foo', qual_name='Foo')
-        target.add_node('sum', qual_name='Foo.do_sum')
-        target.add_node('new_foo', qual_name='Foo')
-        target.add_edge('foo', outputs, sourceport='return')
-        target.add_edge('foo', 'sum', sourceport='return', targetport='self')
-        target.add_edge('sum', 'new_foo', sourceport='return', targetport='x')
-        target.add_edge('new_foo', outputs, sourceport='return')
+        target.add_nodes_from([
+            ('foo', { 'qual_name': 'Foo' }),
+            ('sum', { 'qual_name': 'Foo.do_sum' }),
+            ('new_foo', { 'qual_name': 'Foo' }),
+        ])
+        target.add_edges_from([
+            ('foo', outputs, { 'sourceport': 'return' }),
+            ('foo', 'sum', { 'sourceport': 'return', 'targetport': 'self' }),
+            ('sum', 'new_foo', { 'sourceport': 'return', 'targetport': 'x' }),
+            ('new_foo', outputs, { 'sourceport': 'return' }),
+        ])
         self.assert_isomorphic(actual, target, check_id=False)
     
     def test_primitive_compound_assignment(self):
@@ -433,14 +638,18 @@ class TestFlowGraph(unittest.TestCase):
         """)
 
         target = new_flow_graph()
-        target.add_node('list', qual_name='__list__')
-        target.add_node('min', qual_name='min')
-        target.add_node('max', qual_name='max')
-        target.add_node('add', qual_name='add')
-        target.add_edge('list', 'min', sourceport='return', targetport='0')
-        target.add_edge('list', 'max', sourceport='return', targetport='0')
-        target.add_edge('min', 'add', sourceport='return', targetport='a')
-        target.add_edge('max', 'add', sourceport='return', targetport='b')
+        target.add_nodes_from([
+            ('list', { 'qual_name': '__list__' }),
+            ('min', { 'qual_name': 'min' }),
+            ('max', { 'qual_name': 'max' }),
+            ('add', { 'qual_name': 'add' }),
+        ])
+        target.add_edges_from([
+            ('list', 'min', { 'sourceport': 'return', 'targetport': '0' }),
+            ('list', 'max', { 'sourceport': 'return', 'targetport': '0' }),
+            ('min', 'add', { 'sourceport': 'return', 'targetport': 'a' }),
+            ('max', 'add', { 'sourceport': 'return', 'targetport': 'b' }),
+        ])
         self.assert_isomorphic(actual, target)
     
     def test_track_inside_list(self):
@@ -455,17 +664,36 @@ class TestFlowGraph(unittest.TestCase):
         
         target = new_flow_graph()
         outputs = target.graph['output_node']
-        target.add_node('foo1', qual_name='Foo')
-        target.add_node('foo2', qual_name='Foo')
-        target.add_node('list', qual_name='__list__')
-        target.add_node('foo_x_sum', qual_name='foo_x_sum')
-        target.add_edge('foo1', 'list', id=self.id('foo1'),
-                        sourceport='return', targetport='0')
-        target.add_edge('foo2', 'list', id=self.id('foo2'),
-                        sourceport='return', targetport='1')
-        target.add_edge('list', 'foo_x_sum', sourceport='return', targetport='foos')
-        target.add_edge('foo1', outputs, id=self.id('foo1'), sourceport='return')
-        target.add_edge('foo2', outputs, id=self.id('foo2'), sourceport='return')
+        target.add_nodes_from([
+            ('foo1', { 'qual_name': 'Foo' }),
+            ('foo2', { 'qual_name': 'Foo' }),
+            ('list', { 'qual_name': '__list__' }),
+            ('foo_x_sum', { 'qual_name': 'foo_x_sum' }),
+        ])
+        target.add_edges_from([
+            ('foo1', 'list', {
+                'id': self.id('foo1'),
+                'sourceport': 'return',
+                'targetport': '0',
+            }),
+            ('foo2', 'list', {
+                'id': self.id('foo2'),
+                'sourceport': 'return',
+                'targetport': '1',
+            }),
+            ('list', 'foo_x_sum', {
+                'sourceport': 'return',
+                'targetport': 'foos',
+            }),
+            ('foo1', outputs, {
+                'id': self.id('foo1'),
+                'sourceport': 'return',
+            }),
+            ('foo2', outputs, {
+                'id': self.id('foo2'),
+                'sourceport': 'return',
+            }),
+        ])
         self.assert_isomorphic(actual, target)
     
     def test_function_annotations(self):
@@ -476,7 +704,7 @@ class TestFlowGraph(unittest.TestCase):
             bar = objects.bar_from_foo(foo)
         """)
 
-        node = find_node(graph, lambda n: n.get('qual_name') == 'create_foo')
+        node = self.node_by_qual_name(graph, 'create_foo')
         actual = graph.nodes[node]
         actual.pop('ports', None)
         desired = {
@@ -487,7 +715,7 @@ class TestFlowGraph(unittest.TestCase):
         }
         self.assertEqual(actual, desired)
         
-        node = find_node(graph, lambda n: n.get('qual_name') == 'bar_from_foo')
+        node = self.node_by_qual_name(graph, 'bar_from_foo')
         note = graph.nodes[node]['annotation']
         actual = graph.nodes[node]
         actual.pop('ports', None)
@@ -508,10 +736,10 @@ class TestFlowGraph(unittest.TestCase):
         """)
             
         output_node = graph.graph['output_node']
-        foo_node = find_node(graph, lambda n: n.get('qual_name') == 'create_foo')
-        bar_node = find_node(graph, lambda n: n.get('qual_name') == 'bar_from_foo')
+        foo_node = self.node_by_qual_name(graph, 'create_foo')
+        bar_node = self.node_by_qual_name(graph, 'bar_from_foo')
         
-        actual = graph.edges[foo_node, bar_node, 0]
+        actual = graph[foo_node][bar_node][0]
         desired = {
             'sourceport': 'return',
             'targetport': 'foo',
@@ -520,7 +748,7 @@ class TestFlowGraph(unittest.TestCase):
         }
         self.assertEqual(actual, desired)
         
-        actual = graph.edges[bar_node, output_node, 0]
+        actual = graph[bar_node][output_node][0]
         desired = {
             'sourceport': 'return',
             'id': self.id('bar'),
@@ -535,7 +763,7 @@ class TestFlowGraph(unittest.TestCase):
             foo = objects.Foo()
         """)
         
-        node = find_node(graph, lambda n: n.get('qual_name') == 'Foo')
+        node = self.node_by_qual_name(graph, 'Foo')
         actual = graph.nodes[node]
         actual.pop('ports', None)
         desired = {
@@ -554,7 +782,7 @@ class TestFlowGraph(unittest.TestCase):
             bar = objects.bar_from_foo(foo, 10)
         """)
         
-        node = find_node(graph, lambda n: n.get('qual_name') == 'bar_from_foo')
+        node = self.node_by_qual_name(graph, 'bar_from_foo')
         actual = self.get_ports(graph, node, 'input')
         desired = OrderedDict([
             ('foo', {
@@ -583,7 +811,7 @@ class TestFlowGraph(unittest.TestCase):
             objects.sum_varargs(1,2,3,w=4)
         """)
         
-        node = find_node(graph, lambda n: n.get('qual_name') == 'sum_varargs')
+        node = self.node_by_qual_name(graph, 'sum_varargs')
         actual = self.get_ports(graph, node, 'input')
         desired = OrderedDict([
             ('x', {
@@ -621,7 +849,7 @@ class TestFlowGraph(unittest.TestCase):
             x = foo.do_sum()
         """)
         
-        node = find_node(graph, lambda n: n.get('qual_name') == 'Foo.do_sum')
+        node = self.node_by_qual_name(graph, 'Foo.do_sum')
         actual = self.get_ports(graph, node, 'output')
         desired = OrderedDict([
             ('return', {
@@ -634,7 +862,7 @@ class TestFlowGraph(unittest.TestCase):
         ])
         self.assertEqual(actual, desired)
         
-        node = find_node(graph, lambda n: n.get('qual_name') == 'create_foo')
+        node = self.node_by_qual_name(graph, 'create_foo')
         actual = self.get_ports(graph, node, 'output')
         desired = OrderedDict([
             ('return', {
@@ -657,7 +885,7 @@ class TestFlowGraph(unittest.TestCase):
             bar = objects.bar_from_foo_mutating(foo)
         """)
             
-        node = find_node(graph, lambda n: n.get('qual_name') == 'bar_from_foo_mutating')
+        node = self.node_by_qual_name(graph, 'bar_from_foo_mutating')
         actual = self.get_ports(graph, node, 'output')
         desired = OrderedDict([
             ('return', {
@@ -691,11 +919,13 @@ class TestFlowGraph(unittest.TestCase):
         target = new_flow_graph()
         outputs = target.graph['output_node']
         target.add_node('1', qual_name='create_foo_and_bar')
-        target.add_edge('1', outputs, id=self.id('foo'), sourceport='return.0')
-        target.add_edge('1', outputs, id=self.id('bar'), sourceport='return.1')
+        target.add_edges_from([
+            ('1', outputs, { 'id': self.id('foo'), 'sourceport': 'return.0' }),
+            ('1', outputs, { 'id': self.id('bar'), 'sourceport': 'return.1' }),
+        ])
         self.assert_isomorphic(graph, target)
         
-        node = find_node(graph, lambda n: n.get('qual_name') == 'create_foo_and_bar')
+        node = self.node_by_qual_name(graph, 'create_foo_and_bar')
         actual = self.get_ports(graph, node, 'output')
         desired = OrderedDict([
             ('return.0', {
@@ -742,14 +972,24 @@ class TestFlowGraph(unittest.TestCase):
         actual = graph
         target = new_flow_graph()
         outputs = target.graph['output_node']
-        target.add_node('foo', qual_name='FooSlots')
-        target.add_node('x', qual_name='getattr', slot='x')
-        target.add_node('y', qual_name='getattr', slot='y')
-        target.add_edge('foo', 'x', id=self.id('foo'),
-                        sourceport='return', targetport='0')
-        target.add_edge('foo', 'y', id=self.id('foo'),
-                        sourceport='return', targetport='0')
-        target.add_edge('foo', outputs, id=self.id('foo'), sourceport='return')
+        target.add_nodes_from([
+            ('foo', { 'qual_name': 'FooSlots' }),
+            ('x', { 'qual_name': 'getattr', 'slot': 'x' }),
+            ('y', { 'qual_name': 'getattr', 'slot': 'y' }),
+        ])
+        target.add_edges_from([
+            ('foo', 'x', {
+                'id': self.id('foo'),
+                'sourceport': 'return',
+                'targetport': '0',
+            }),
+            ('foo', 'y', {
+                'id': self.id('foo'),
+                'sourceport': 'return',
+                'targetport': '0',
+            }),
+            ('foo', outputs, { 'id': self.id('foo'), 'sourceport': 'return' }),
+        ])
         self.assert_isomorphic(actual, target)
         
         node = find_node(graph, lambda n: n.get('slot') == 'x')
@@ -781,17 +1021,30 @@ class TestFlowGraph(unittest.TestCase):
         actual = graph
         target = new_flow_graph()
         outputs = target.graph['output_node']
-        target.add_node('1', qual_name='FooSlots')
-        target.add_node('x', slot='x')
-        target.add_node('y', slot='y')
-        target.add_node('sum', slot='do_sum')
-        target.add_edge('1', 'x', id=self.id('foo'),
-                        sourceport='return', targetport='self')
-        target.add_edge('1', 'y', id=self.id('foo'),
-                        sourceport='return', targetport='self')
-        target.add_edge('1', 'sum', id=self.id('foo'),
-                        sourceport='return', targetport='self')
-        target.add_edge('1', outputs, id=self.id('foo'), sourceport='return')
+        target.add_nodes_from([
+            ('1', { 'qual_name': 'FooSlots' }),
+            ('x', { 'slot': 'x' }),
+            ('y', { 'slot': 'y' }),
+            ('sum', { 'slot': 'do_sum' }),
+        ])
+        target.add_edges_from([
+            ('1', 'x', {
+                'id': self.id('foo'),
+                'sourceport': 'return',
+                'targetport': 'self',
+            }),
+            ('1', 'y', {
+                'id': self.id('foo'),
+                'sourceport': 'return',
+                'targetport': 'self',
+            }),
+            ('1', 'sum', {
+                'id': self.id('foo'),
+                'sourceport': 'return',
+                'targetport': 'self',
+            }),
+            ('1', outputs, { 'id': self.id('foo'), 'sourceport': 'return' }),
+        ])
         self.assert_isomorphic(actual, target)
         
         node = find_node(graph, lambda n: n.get('slot') == 'do_sum')
@@ -824,12 +1077,22 @@ class TestFlowGraph(unittest.TestCase):
         
         target = new_flow_graph()
         outputs = target.graph['output_node']
-        target.add_node('1', qual_name='FooContainer')
-        target.add_node('foo', slot='foo')
-        target.add_edge('1', 'foo', id=self.id('container'),
-                        sourceport='return', targetport='self')
-        target.add_edge('foo', outputs, id=self.id('foo'), sourceport='return')
-        target.add_edge('1', outputs, id=self.id('container'), sourceport='return')
+        target.add_nodes_from([
+            ('1', { 'qual_name': 'FooContainer' }),
+            ('foo', { 'slot': 'foo' }),
+        ])
+        target.add_edges_from([
+            ('1', 'foo', {
+                'id': self.id('container'),
+                'sourceport': 'return',
+                'targetport': 'self',
+            }),
+            ('foo', outputs, { 'id': self.id('foo'), 'sourceport': 'return' }),
+            ('1', outputs, {
+                'id': self.id('container'),
+                'sourceport': 'return',
+            }),
+        ])
         self.assert_isomorphic(actual, target)
     
     def test_two_join_three_object_flow(self):
@@ -895,6 +1158,28 @@ class TestFlowGraph(unittest.TestCase):
         joined = join(first, second)
         self.assert_isomorphic(joined, full, check_id=False)
     
+    def test_join_colliding_node_names(self):
+        """ Test join of two recordings whose node names collide.
+        
+        Separate recordings name their nodes alike, so joining them merges
+        their nodes, but no edge may be lost.
+        """
+        code = """
+            foo = objects.Foo()
+            bar = objects.bar_from_foo(foo)
+        """
+        first = self.record(code, env={})
+        second = self.record(code, env={})
+        self.assertEqual(set(first.nodes), set(second.nodes))
+        
+        joined = join(first, second)
+        self.assertEqual(joined.number_of_edges(),
+                         first.number_of_edges() + second.number_of_edges())
+        self.assertEqual(
+            Counter((u, v) for u, v in joined.edges()),
+            Counter((u, v) for u, v in first.edges()) +
+            Counter((u, v) for u, v in second.edges()))
+    
     def test_graphml_serialization(self):
         """ Can a flow graph be roundtripped through GraphML?
         """
@@ -985,5 +1270,78 @@ class TestFlowGraph(unittest.TestCase):
         self.assertEqual(outputs, [ self.id('bar') ])
 
 
+def _canonical(graph, check_id=True):
+    """ Get canonical form of a flow graph for isomorphism testing.
+    
+    Nodes are labeled by their qualified name and slot, or by their role if
+    they are the input or output node. Labels that are not unique are refined
+    by the labeled edges incident to the node, which distinguishes most nodes
+    when the edges carry object IDs. Returns None if the labels are still not
+    unique, since then the canonical form does not determine the graph.
+    """
+    roles = {
+        graph.graph.get('input_node'): '__in__',
+        graph.graph.get('output_node'): '__out__',
+    }
+    labels = {}
+    for node, data in graph.nodes(data=True):
+        label = roles.get(node) or \
+            tuple(data.get(attr) for attr in _NODE_ATTRS)
+        labels[node] = label
+    
+    # Match multi-edges like the VF2 edge matcher, by the number of edges and
+    # the set of their attributes.
+    edge_attrs = _edge_attrs(check_id)
+    pairs = {}
+    for src, tgt, data in graph.edges(data=True):
+        pairs.setdefault((src, tgt), []).append(
+            tuple(data.get(attr) for attr in edge_attrs))
+    pairs = { pair: (len(values), frozenset(values))
+              for pair, values in pairs.items() }
+    
+    # Refine the labels until they are unique or stop improving. Refinement
+    # respects isomorphism, so unique labels determine the only candidate.
+    nlabels = len(set(labels.values()))
+    while nlabels < len(labels):
+        incident = { node: Counter() for node in labels }
+        for (src, tgt), edges in pairs.items():
+            incident[src]['out', labels[tgt], edges] += 1
+            incident[tgt]['in', labels[src], edges] += 1
+        labels = { node: (label, frozenset(incident[node].items()))
+                   for node, label in labels.items() }
+        refined = len(set(labels.values()))
+        if refined == nlabels:
+            return None
+        nlabels = refined
+    
+    edges = { (labels[src], labels[tgt]): value
+              for (src, tgt), value in pairs.items() }
+    return (frozenset(labels.values()), edges)
+
+def _keyed(graph, check_id=True):
+    """ Copy flow graph, keeping only a tuple of the node or edge attributes
+    compared for isomorphism.
+    """
+    edge_attrs = _edge_attrs(check_id)
+    keyed = nx.MultiDiGraph()
+    keyed.add_nodes_from(
+        (node, { 'match_key': tuple(data.get(attr) for attr in _NODE_ATTRS) })
+        for node, data in graph.nodes(data=True))
+    keyed.add_edges_from(
+        (src, tgt, key,
+         { 'match_key': tuple(data.get(attr) for attr in edge_attrs) })
+        for src, tgt, key, data in graph.edges(keys=True, data=True))
+    return keyed
+
+def _edge_attrs(check_id=True):
+    """ Get the edge attributes compared for isomorphism.
+    """
+    return ('id', 'sourceport', 'targetport') if check_id else \
+        ('sourceport', 'targetport')
+
+# Node attributes compared for isomorphism.
+_NODE_ATTRS = ('qual_name', 'slot')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -18,6 +18,10 @@ import unittest
 import networkx as nx
 
 from ..graphml import read_graphml_str, write_graphml_str
+try:
+    from ..graphml_lxml import write_graphml_str_lxml
+except ImportError:
+    write_graphml_str_lxml = None
 
 
 def roundtrip(graph, **kwargs):
@@ -26,6 +30,17 @@ def roundtrip(graph, **kwargs):
     xml = write_graphml_str(graph, **kwargs)
     return read_graphml_str(xml)
 
+def graph_contents(graph):
+    """ Get the data, nodes, and edges of a graph, including nested graphs.
+    """
+    nodes = []
+    for node, data in graph.nodes(data=True):
+        data = dict(data)
+        if isinstance(data.get('graph'), nx.Graph):
+            data['graph'] = graph_contents(data['graph'])
+        nodes.append((node, data))
+    return (graph.graph, nodes, list(graph.edges(data=True)))
+
 
 class TestGraphMLIO(unittest.TestCase):
     """ Test reading and writing GraphML.
@@ -171,5 +186,83 @@ class TestGraphMLIO(unittest.TestCase):
         self.assertTrue('targetport="p1"' in xml)
 
 
+
+@unittest.skipIf(write_graphml_str_lxml is None, "requires lxml")
+class TestStreamingGraphMLWriter(unittest.TestCase):
+    """ Test the streaming GraphML writer based on lxml.
+    """
+
+    def assert_same_graphml(self, graph):
+        """ Assert that both writers produce equivalent GraphML.
+        """
+        expected = read_graphml_str(write_graphml_str(graph))
+        actual = read_graphml_str(write_graphml_str_lxml(graph))
+        self.assertEqual(graph_contents(actual), graph_contents(expected))
+
+    def test_basic_graph(self):
+        """ Does the streaming writer agree on a graph with data?
+        """
+        graph = nx.DiGraph()
+        graph.graph['name'] = 'foo-graph'
+        graph.add_node('foo', kind='entity', tags=['x', 'y'])
+        graph.add_node('bar', value=1.5)
+        graph.add_edge('foo', 'bar', id=0)
+        graph.add_edge('foo', 'baz', id=1, data={'a': None})
+        self.assert_same_graphml(graph)
+
+    def test_nested_graph_with_ports(self):
+        """ Does the streaming writer agree on nested graphs and ports?
+        """
+        inner = nx.DiGraph()
+        inner.graph.update({'input_node': '__in__', 'output_node': '__out__'})
+        inner.add_edge('__in__', 'a', targetport='x')
+        inner.add_edge('a', '__out__', sourceport='y')
+        graph = nx.DiGraph()
+        graph.add_node('n', graph=inner, ports={'x': {}, 'y': {}})
+        graph.add_node('m', ports={'z': {'portkind': 'output'}})
+        graph.add_edge('m', 'n', sourceport='z', targetport='x')
+        self.assert_same_graphml(graph)
+
+    def test_duplicate_node_ids(self):
+        """ Does the streaming writer reject duplicate node IDs?
+        """
+        inner = nx.Graph()
+        inner.add_node('foo')
+        graph = nx.Graph()
+        graph.add_node('foo', graph=inner)
+        self.assertRaises(nx.NetworkXError, write_graphml_str_lxml, graph)
+
+    def test_deeply_nested_graph(self):
+        """ Does the streaming writer agree on doubly nested graphs?
+        """
+        innermost = nx.DiGraph()
+        innermost.graph['node'] = '__self__'
+        innermost.add_edge('__self__', 'c', id=2)
+        inner = nx.DiGraph()
+        inner.graph['node'] = '__self__'
+        inner.add_node('b', graph=innermost)
+        inner.add_edge('__self__', 'b', id=1)
+        graph = nx.DiGraph()
+        graph.add_node('a', graph=inner, kind='box')
+        self.assert_same_graphml(graph)
+
+    def test_control_characters(self):
+        """ Does the streaming writer reject strings that are not XML
+        compatible, which the ElementTree writer accepts?
+        """
+        graph = nx.DiGraph()
+        graph.add_node('foo', value='\x1b[31mred')
+        write_graphml_str(graph)
+        self.assertRaises(ValueError, write_graphml_str_lxml, graph)
+
+    def test_prettyprint(self):
+        """ Does the streaming writer reject pretty-printing?
+        """
+        graph = nx.DiGraph()
+        graph.add_node('foo')
+        self.assertRaises(ValueError, write_graphml_str_lxml, graph,
+                          prettyprint=True)
+
+
 if __name__ == '__main__':
     unittest.main()
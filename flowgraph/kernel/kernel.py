@@ -16,12 +16,16 @@ from __future__ import absolute_import
 
 from ipykernel.ipkernel import IPythonKernel
 from networkx.readwrite import json_graph
-from traitlets import Bool, Enum, Instance, Type, default
+from traitlets import Any, Bool, Enum, Instance, Type, default
 
 from ..core.annotator import Annotator
 from ..core.flow_graph import flow_graph_to_graphml
 from ..core.flow_graph_builder import FlowGraphBuilder
 from ..core.graphml import write_graphml_str
+try:
+    from ..core.graphml_lxml import write_graphml_str_lxml
+except ImportError:
+    write_graphml_str_lxml = None
 from ..core.remote_annotation_db import RemoteAnnotationDB
 from ..trace.tracer import Tracer
 from .serialize import object_to_json
@@ -50,6 +54,7 @@ class FlowGraphIPythonKernel(IPythonKernel):
     
     # Private traits.
     _builder = Instance(FlowGraphBuilder)
+    _graphml_cache = Any() # Tuple(key, str)
     _tracer = Instance(Tracer, args=())
     _trace_flag = Bool()
 
@@ -78,10 +83,7 @@ class FlowGraphIPythonKernel(IPythonKernel):
         
         # Add flow graph as a payload.
         if self._trace_flag and reply_content['status'] == 'ok':
-            graph = self._builder.graph
-            graphml = flow_graph_to_graphml(
-                graph, outputs=self.flow_graph_outputs)
-            data = write_graphml_str(graphml, prettyprint=False)
+            data = self._get_graphml_str()
             payload = {
                 'source': 'flow_graph',
                 'mimetype': 'application/graphml+xml',
@@ -123,6 +125,33 @@ class FlowGraphIPythonKernel(IPythonKernel):
                                 reply_content, parent, ident)
         self.log.debug("%s", msg)
     
+    # Private interface
+    
+    def _get_graphml_str(self):
+        """ Get the current flow graph serialized as GraphML.
+        
+        The serialization is cached until the flow graph changes, e.g., for
+        repeated executions that do not trace anything.
+        """
+        key = (self._builder.graph_version, self.flow_graph_outputs)
+        if self._graphml_cache is not None and self._graphml_cache[0] == key:
+            return self._graphml_cache[1]
+        
+        graphml = flow_graph_to_graphml(
+            self._builder.graph, outputs=self.flow_graph_outputs)
+        data = None
+        if write_graphml_str_lxml is not None:
+            # Stream the GraphML with lxml, if available. lxml rejects strings
+            # that are not XML compatible, e.g., with control characters.
+            try:
+                data = write_graphml_str_lxml(graphml)
+            except ValueError:
+                pass
+        if data is None:
+            data = write_graphml_str(graphml, prettyprint=False)
+        self._graphml_cache = (key, data)
+        return data
+    
     # Trait initializers
     
     @default('annotator')
@@ -137,11 +166,5 @@ class FlowGraphIPythonKernel(IPythonKernel):
             annotator=self.annotator,
             store_slots=self.flow_graph_slots,
         )
-
-        def handler(changed):
-            event = changed['new']
-            if event:
-                builder.push_event(event)
-        self._tracer.observe(handler, 'event')
-    
+        self._tracer.observe(builder.push_change, 'event')
         return builder
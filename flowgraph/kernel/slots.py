@@ -28,8 +28,11 @@ def get_slots(obj, slots):
         return { key: get_slots(obj, value) for key, value in slots.items() }
     elif isinstance(slots, list):
         return [ get_slots(obj, value) for value in slots ]
-    elif isinstance(slots, six.integer_types + six.string_types):
-        return get_slot(obj, slots)
+    elif isinstance(slots, six.string_types):
+        # Fast path for the common leaf: skip the dispatch in `get_slot`.
+        return reduce(_get_single_slot, _parse_slot(slots), obj)
+    elif isinstance(slots, six.integer_types):
+        return obj[slots]
     else:
         raise TypeError("`slots` must be dict, list, string, or integer")
 
@@ -47,33 +50,58 @@ def get_slot(obj, slot):
     Raises an AttributeError if the slot cannot be retrieved.
     """
     if isinstance(slot, six.string_types):
-        keys = slot.split('.')
-        return reduce(_get_single_slot, keys, obj)
+        return reduce(_get_single_slot, _parse_slot(slot), obj)
     elif isinstance(slot, six.integer_types):
         return obj[slot]
     else:
         raise TypeError("`slot` must be string or integer")
 
+def _parse_slot(slot):
+    """ Parse a dotted slot string into a tuple of keys.
+    
+    Each key is a pair consisting of the attribute name and the key used for
+    dictionary lookup or list indexing, an integer if the name is numeric. The
+    same slots recur across many objects, so the parse is cached.
+    """
+    keys = _parsed_slot_cache.get(slot)
+    if keys is None:
+        keys = []
+        for name in slot.split('.'):
+            try:
+                item = int(name)
+            except ValueError:
+                item = name
+            keys.append((name, item))
+        keys = tuple(keys)
+        if len(_parsed_slot_cache) >= _PARSED_SLOT_CACHE_SIZE:
+            _parsed_slot_cache.clear()
+        _parsed_slot_cache[slot] = keys
+    return keys
+
+# Cache of parsed slot strings. Slots come from annotations, so there are
+# usually few of them, but unlike the type-keyed caches elsewhere, which are
+# weakly keyed, this cache holds strings sent by kernel clients and so is
+# bounded, crudely, by clearing it when full.
+_parsed_slot_cache = {}
+_PARSED_SLOT_CACHE_SIZE = 1024
+
 def _get_single_slot(obj, key):
+    name, item = key
     try:
-        value = getattr(obj, key)
+        value = getattr(obj, name)
     except AttributeError:
         try:
-            key = int(key)
-        except ValueError:
-            pass
-        try:
-            return obj[key]
-        except:
-            raise AttributeError("Cannot retrieve slot %r" % key)
+            return obj[item]
+        except (LookupError, TypeError, ValueError):
+            raise AttributeError("Cannot retrieve slot %r" % item)
     else:
         if inspect.ismethod(value):
             if not value.__self__ is obj:
                 raise AttributeError(
-                    "Cannot retrieve method slot %r: method not bound to object" % key)
+                    "Cannot retrieve method slot %r: method not bound to object" % name)
             if six.get_function_code(value).co_argcount > 1:
                 raise AttributeError(
-                    "Cannot retrieve method slot %r: too many arguments" % key)
+                    "Cannot retrieve method slot %r: too many arguments" % name)
             return value()
         else:
             return value
@@ -105,6 +105,19 @@ class TestFlowGraphKernel(unittest.TestCase):
         graph = read_graphml_str(payload['data'])
         self.assertTrue(isinstance(graph, nx.DiGraph))
     
+    def test_execute_request_control_characters(self):
+        """ Do execute requests with control characters in strings have flow
+        graph payloads?
+        """
+        with kernel() as kc:
+            content = safe_execute('n = len("\\x1b[31mred")', kc)
+        
+        payloads = [ payload for payload in content['payload']
+                     if payload['source'] == 'flow_graph' ]
+        self.assertEqual(len(payloads), 1)
+        graph = read_graphml_str(payloads[0]['data'])
+        self.assertTrue(isinstance(graph, nx.DiGraph))
+    
     def test_inspect_request(self):
         """ Are inspect requests for annotated objects processed correctly?
         """
@@ -86,6 +86,15 @@ class TestSlotFunctions(unittest.TestCase):
         """
         obj = Struct({'objects': {'id1': 'foo', 'id2': 'bar'}})
         self.assertEqual(get_slot(obj, 'objects.id1'), 'foo')
+    
+    def test_missing_slot(self):
+        """ Check that missing slots raise AttributeError.
+        """
+        obj = Struct({'objects': ['foo'], 'table': {'id1': 'foo'}})
+        self.assertRaises(AttributeError, lambda: get_slot(obj, 'x'))
+        self.assertRaises(AttributeError, lambda: get_slot(obj, 'objects.1'))
+        self.assertRaises(AttributeError, lambda: get_slot(obj, 'table.id2'))
+        self.assertRaises(AttributeError, lambda: get_slot(1, 'x'))
 
 
 if __name__ == '__main__':
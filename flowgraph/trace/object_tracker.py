@@ -20,6 +20,16 @@ import weakref
 
 from traitlets import HasTraits, Dict, Int
 
+# Common built-in types that are not weak-referenceable.
+_UNTRACKABLE_TYPES = frozenset(
+    (bool, float, bytes, six.text_type, type(None), tuple, list, dict) +
+    six.integer_types
+)
+
+# Cache: mapping from type to whether instances of the type are trackable.
+# Weakly keyed, so that classes redefined in a long-running session are freed.
+_trackable_type_cache = weakref.WeakKeyDictionary()
+
 
 class ObjectTracker(HasTraits):
     """ Allow object lookup by ID without creating references to the object.
@@ -74,6 +84,43 @@ class ObjectTracker(HasTraits):
         `tuple`, `list`, and `dict` types. The latter fact is especially
         inconvenient.
         """
+        # Fast path for the most common untrackable types.
+        obj_type = type(obj)
+        if obj_type in _UNTRACKABLE_TYPES:
+            return False
+        
+        # Trackability depends only on the type, so cache it.
+        trackable = _trackable_type_cache.get(obj_type)
+        if trackable is None:
+            trackable = _trackable_type_cache[obj_type] = \
+                cls._check_trackable(obj)
+        return trackable
+    
+    def track(self, obj):
+        """ Track an object.
+        
+        Returns an ID for the object. Raises a `ValueError` if object is not
+        trackable.
+        """
+        if not self.is_trackable(obj):
+            raise ValueError("Cannot track object of type %r" % type(obj))
+        return self._track(obj)
+
+    def maybe_track(self, obj):
+        """ Track an object, if it can be tracked.
+
+        Returns an ID for the object or None.
+        """
+        if not self.is_trackable(obj):
+            return None
+        return self._track(obj)
+    
+    # Private interface
+    
+    @classmethod
+    def _check_trackable(cls, obj):
+        """ Check whether an object is trackable, bypassing the cache.
+        """
         # We never track function, method, or module objects, even though they
         # are weakref-able.
         if isinstance(obj, (types.FunctionType, types.MethodType, 
@@ -88,15 +135,9 @@ class ObjectTracker(HasTraits):
             return False
         return True
     
-    def track(self, obj):
-        """ Track an object.
-        
-        Returns an ID for the object. Raises a `ValueError` if object is not
-        trackable.
+    def _track(self, obj):
+        """ Track an object, assuming that it is trackable.
         """
-        if not self.is_trackable(obj):
-            raise ValueError("Cannot track object of type %r" % type(obj))
-        
         # Check if object is already being tracked.
         obj_addr = id(obj)
         if obj_addr in self._mem_map:
@@ -119,13 +160,3 @@ class ObjectTracker(HasTraits):
         self._ref_map[obj_id] = weakref.ref(obj, obj_gc_callback)
         
         return obj_id
-
-    def maybe_track(self, obj):
-        """ Track an object, if it can be tracked.
-
-        Returns an ID for the object or None.
-        """
-        try:
-            return self.track(obj)
-        except ValueError:
-            return None
@@ -16,6 +16,7 @@ from __future__ import absolute_import
 
 import gc
 import unittest
+import weakref
 
 from flowgraph.core.tests import objects
 from ..object_tracker import ObjectTracker
@@ -30,10 +31,24 @@ class TestObjectTracker(unittest.TestCase):
         self.assertFalse(is_trackable(None))
         self.assertFalse(is_trackable(0))
         self.assertFalse(is_trackable('foo'))
+        self.assertFalse(is_trackable((0, 1)))
+        self.assertFalse(is_trackable([0, 1]))
+        self.assertFalse(is_trackable({'x': 0}))
         
         foo = objects.Foo()
         self.assertTrue(is_trackable(foo))
         self.assertFalse(is_trackable(foo.do_sum))
+    
+    def test_maybe_track(self):
+        """ Are only trackable objects tracked by `maybe_track`?
+        """
+        tracker = ObjectTracker()
+        self.assertEqual(tracker.maybe_track(0), None)
+        self.assertEqual(tracker.maybe_track([0, 1]), None)
+        
+        foo = objects.Foo()
+        foo_id = tracker.maybe_track(foo)
+        self.assertEqual(tracker.get_id(foo), foo_id)
 
     def test_get_object(self):
         """ Can we get a tracked object by ID?
@@ -58,6 +73,18 @@ class TestObjectTracker(unittest.TestCase):
         del foo
         gc.collect()
         self.assertFalse(tracker.get_object(foo_id))
+    
+    def test_type_cleanup(self):
+        """ Are classes checked for trackability garbage collected?
+        """
+        class Local(object):
+            pass
+        self.assertTrue(ObjectTracker.is_trackable(Local()))
+        
+        ref = weakref.ref(Local)
+        del Local
+        gc.collect()
+        self.assertIsNone(ref())
         
 
 if __name__ == '__main__':
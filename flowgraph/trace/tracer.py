@@ -18,6 +18,7 @@ import ast
 from collections import deque, OrderedDict
 import six
 import types
+from weakref import WeakKeyDictionary
 
 from traitlets import HasTraits, Any, Bool, Instance, Int, List
 
@@ -51,6 +52,9 @@ class Tracer(ASTTracer):
 
     # Scope stack for currently executing code.
     _stack = Instance(deque, ()) # List(Instance(_ScopeItem))
+
+    # Cache of module name and atomicity for Python functions.
+    _function_module_cache = Instance(WeakKeyDictionary, ())
     
     # Tracer interface
 
@@ -257,9 +261,8 @@ class Tracer(ASTTracer):
         """ Create trace event for function call.
         """
         # Inspect the function.
-        module_name = get_func_module_name(func)
+        module_name, atomic = self._inspect_func_module(func)
         qual_name = get_func_qual_name(func)
-        atomic = module_name != self.__class__.__module__
 
         # Unbox any trace events carrying argument values.
         argument_events = {}
@@ -273,6 +276,26 @@ class Tracer(ASTTracer):
                          module_name=module_name, qual_name=qual_name,
                          arguments=arguments, argument_events=argument_events)
     
+    def _inspect_func_module(self, func):
+        """ Get module name of function and whether calls to it are atomic.
+        
+        The result is cached for Python functions, including the functions
+        underlying bound methods, since the same functions are called over and
+        over again in a typical trace.
+        """
+        key = func.__func__ if isinstance(func, types.MethodType) else func
+        cacheable = isinstance(key, types.FunctionType)
+        if cacheable:
+            info = self._function_module_cache.get(key)
+            if info is not None:
+                return info
+        
+        module_name = get_func_module_name(func)
+        info = (module_name, module_name != self.__class__.__module__)
+        if cacheable:
+            self._function_module_cache[key] = info
+        return info
+
     def _create_return_event(self, call_event, return_value, multiple_values):
         """ Create trace event for function return.
         """
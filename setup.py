@@ -32,7 +32,10 @@ setup_args = {
             'pandas',
             'sklearn',
             'statsmodels',
-        ]
+        ],
+        'lxml': [
+            'lxml',
+        ],
     },
 }
 